@@ -0,0 +1,75 @@
+"""
+Measures how long the CLI takes to start, using 'python -X importtime' on
+FSMD.main and timing 'FSMD --help' end to end. It fails if importing the CLI
+takes longer than the target, or loads a module that only some commands need.
+Run it with FSMD installed, or from the repository root with PYTHONPATH=src:
+
+    python benchmarks/bench_startup.py [TARGET_MS] [RUNS]
+"""
+import subprocess
+import sys
+import time
+
+# The import time to stay under, in milliseconds.
+TARGET_MS = 100
+# Modules that must only be imported by the commands that use them.
+LAZY_MODULES = ("graphviz", "yaml", "requests", "rich.console", "numpy", "FSMD.install")
+
+
+def importTimes() -> dict:
+    """
+    Imports FSMD.main in a fresh interpreter, returning the self and cumulative
+    time in microseconds of every module it loaded.
+    """
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import FSMD.main"],
+        stderr=subprocess.PIPE,
+        check=True,
+    )
+    times = {}
+    for line in result.stderr.decode().splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        own, cumulative, name = line[len("import time:") :].split("|")
+        times[name.strip()] = (int(own), int(cumulative))
+    return times
+
+
+def helpTime() -> float:
+    startTime = time.perf_counter()
+    subprocess.run(
+        [sys.executable, "-c", "from FSMD import run; run()", "--help"],
+        stdout=subprocess.DEVNULL,
+        check=True,
+    )
+    return time.perf_counter() - startTime
+
+
+def main() -> None:
+    target = float(sys.argv[1]) if len(sys.argv) > 1 else TARGET_MS
+    runs = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+    samples = [importTimes() for _ in range(runs)]
+    best = min(samples, key=lambda times: times["FSMD.main"][1])
+    total = best["FSMD.main"][1] / 1000
+    helpBest = min(helpTime() for _ in range(runs)) * 1000
+
+    print(f"import FSMD.main: {total:8.1f}ms (target {target:g}ms, best of {runs})")
+    print(f"FSMD --help:      {helpBest:8.1f}ms")
+    print("Slowest modules:")
+    slowest = sorted(best.items(), key=lambda item: item[1][0], reverse=True)[:10]
+    for name, (own, _) in slowest:
+        print(f"  {own / 1000:8.1f}ms  {name}")
+
+    failed = False
+    loaded = [name for name in LAZY_MODULES if name in best]
+    if loaded:
+        print(f"FAIL: importing the CLI loaded {', '.join(loaded)}")
+        failed = True
+    if total > target:
+        print(f"FAIL: importing the CLI took longer than {target:g}ms")
+        failed = True
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
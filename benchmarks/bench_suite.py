@@ -0,0 +1,177 @@
+"""
+Times each phase of turning an FSM file into a diagram, on synthetic machines
+from generate.py: YAML load, validation, graph build, DOT serialization, and
+the dot layout and render. Results are written as JSON, and can be compared
+with an earlier run to flag phases that got slower than the threshold.
+Run it with FSMD installed, or from the repository root with PYTHONPATH=src:
+
+    python benchmarks/bench_suite.py -o results.json
+    python benchmarks/bench_suite.py -o new.json --baseline results.json
+
+Rendering is skipped for machines larger than --render-max-states, since dot
+can take minutes on them, and each render is stopped after --timeout seconds.
+"""
+import argparse
+import io
+import json
+import platform
+import subprocess
+import sys
+import time
+from typing import Callable, Dict, List, Optional
+
+import yaml
+
+from generate import TOPOLOGIES, generate
+
+from FSMD.diagram import buildDiagram
+from FSMD.dot import DotException, DotTimeout, dotPath, dotVersion, pipeDot
+from FSMD.loader import SafeDumper, parseStream
+from FSMD.options import DiagramOptions
+from FSMD.validate import validateFSM
+
+SIZES = (10, 100, 1000, 10000, 100000)
+PHASES = ("load", "validate", "build", "serialize", "render")
+# Phases faster than this are too noisy to flag as regressions.
+MIN_SECONDS = 0.001
+
+
+def best(fn: Callable, repeat: int):
+    """
+    Runs fn repeat times, returning its last result and the fastest time.
+    """
+    fastest = float("inf")
+    result = None
+    for _ in range(repeat):
+        startTime = time.perf_counter()
+        result = fn()
+        fastest = min(fastest, time.perf_counter() - startTime)
+    return result, fastest
+
+
+def runCase(
+    topology: str, states: int, repeat: int, renderMax: int, timeout: float
+) -> dict:
+    text = yaml.dump(generate(topology, states), Dumper=SafeDumper, width=1000)
+    times: Dict[str, Optional[float]] = {}
+    data, times["load"] = best(lambda: parseStream(io.StringIO(text), "yaml"), repeat)
+    data, times["validate"] = best(lambda: validateFSM(data), repeat)
+    G, times["build"] = best(lambda: buildDiagram(data, "svg", DiagramOptions()), repeat)
+    source, times["serialize"] = best(lambda: G.source, repeat)
+    times["render"] = None
+    note = ""
+    if len(data["states"]) <= renderMax:
+        try:
+            _, times["render"] = best(lambda: pipeDot(source, "svg", timeout), 1)
+        except DotTimeout:
+            note = f"render took longer than {timeout:g}s"
+        except DotException as dE:
+            note = dE.message
+    return {
+        "topology": topology,
+        "states": len(data["states"]),
+        "transitions": len(data["transitions"]),
+        "phases": times,
+        "note": note,
+    }
+
+
+def gitCommit() -> str:
+    try:
+        result = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+        )
+        return result.stdout.decode().strip()
+    except OSError:
+        return ""
+
+
+def dotInfo() -> str:
+    try:
+        return f"{dotPath()}: {dotVersion()}"
+    except DotException:
+        return ""
+
+
+def compare(baseline: dict, results: dict, threshold: float) -> List[str]:
+    """
+    Returns a line for every phase that is more than threshold slower than in
+    the baseline, matching cases by topology and size.
+    """
+    old = {(r["topology"], r["states"]): r["phases"] for r in baseline["results"]}
+    regressions = []
+    for result in results["results"]:
+        before = old.get((result["topology"], result["states"]))
+        if before is None:
+            continue
+        for phase, seconds in result["phases"].items():
+            was = before.get(phase)
+            if seconds is None or was is None or max(seconds, was) < MIN_SECONDS:
+                continue
+            if seconds > was * (1 + threshold):
+                regressions.append(
+                    f"{result['topology']} {result['states']} {phase}: "
+                    f"{was * 1000:.1f}ms -> {seconds * 1000:.1f}ms "
+                    f"(+{(seconds / was - 1) * 100:.0f}%)"
+                )
+    return regressions
+
+
+def formatTime(seconds: Optional[float]) -> str:
+    return "-" if seconds is None else f"{seconds * 1000:.1f}"
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("-o", "--output", help="Where to write the JSON results.")
+    parser.add_argument("--baseline", help="Earlier results to compare against.")
+    parser.add_argument(
+        "--threshold", type=float, default=0.2, help="Slowdown to flag, 0.2 is 20%%."
+    )
+    parser.add_argument("--topologies", default=",".join(TOPOLOGIES))
+    parser.add_argument("--sizes", default=",".join(str(size) for size in SIZES))
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--render-max-states", type=int, default=2000)
+    parser.add_argument("--timeout", type=float, default=60.0)
+    args = parser.parse_args()
+
+    results = {
+        "meta": {
+            "commit": gitCommit(),
+            "date": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "dot": dotInfo(),
+        },
+        "results": [],
+    }
+    print(f"{'case':<16} {'states':>7} {'edges':>8}  " + "".join(f"{p:>10}" for p in PHASES))
+    for topology in args.topologies.split(","):
+        for size in (int(size) for size in args.sizes.split(",")):
+            result = runCase(topology, size, args.repeat, args.render_max_states, args.timeout)
+            results["results"].append(result)
+            print(
+                f"{topology:<16} {result['states']:>7} {result['transitions']:>8}  "
+                + "".join(f"{formatTime(result['phases'][p]):>10}" for p in PHASES)
+                + (f"  {result['note']}" if result["note"] else ""),
+                flush=True,
+            )
+    print("(times in ms, best of %d)" % args.repeat)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(json.load(f), results, args.threshold)
+        for line in regressions:
+            print(f"REGRESSION {line}")
+        if regressions:
+            sys.exit(1)
+        print(f"No phase is more than {args.threshold * 100:.0f}% slower than the baseline")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,71 @@
+"""
+Compares the single pass validator with the old schema based path on a
+generated machine. The old path is rebuilt here from the schema library, so
+it needs 'pip install schema' to run. Run it with FSMD installed, or from the
+repository root with PYTHONPATH=src:
+
+    python benchmarks/bench_validate.py [TRANSITIONS] [STATES]
+"""
+import random
+import sys
+import time
+
+from FSMD.validate import validateFSM
+
+
+def makeFSM(transitions: int, states: int) -> dict:
+    rng = random.Random(0)
+    names = [f"q_{i}" for i in range(states)]
+    return {
+        "filename": "bench",
+        "states": names,
+        "startstate": names[0],
+        "finalstates": names[-10:],
+        "transitions": [
+            f"{rng.choice(names)};{rng.choice(names)};{i}" for i in range(transitions)
+        ],
+    }
+
+
+def oldValidate(data: dict) -> None:
+    from schema import Regex, Schema, Use
+
+    Schema(
+        {
+            "filename": Use(str),
+            "states": [Regex(r"^[^;]+$")],
+            "startstate": Regex(r"^[^;]+$"),
+            "finalstates": [Regex(r"^[^;]+$")],
+            "transitions": [Regex(r"^[^;]+;[^;]+;[^;]+$")],
+        }
+    ).validate(data)
+    # The old diagram code then checked each edge against a list of states.
+    states = list(data["states"])
+    for edge in data["transitions"]:
+        start, end, _ = edge.split(";")
+        if start not in states or end not in states:
+            raise ValueError(edge)
+
+
+def timeIt(fn, data) -> float:
+    startTime = time.perf_counter()
+    fn(data)
+    return time.perf_counter() - startTime
+
+
+def main() -> None:
+    transitions = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    states = int(sys.argv[2]) if len(sys.argv) > 2 else 1_000
+    data = makeFSM(transitions, states)
+    new = min(timeIt(validateFSM, data) for _ in range(3))
+    print(f"validateFSM:  {new * 1000:8.1f}ms ({transitions} transitions, {states} states)")
+    try:
+        old = timeIt(oldValidate, data)
+    except ImportError:
+        print("schema is not installed, skipping the old path")
+        return
+    print(f"schema path:  {old * 1000:8.1f}ms ({old / new:.1f}x slower)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+"""
+Generates synthetic FSM files for benchmarking. Every topology is seeded, so
+the same arguments always give the same machine:
+
+    dfa    a random complete DFA over a small alphabet
+    nfa    a random NFA, with some epsilon (E) transitions
+    chain  a line of states, each moving to the next
+    grid   a square grid, moving right or down
+    dense  every state moving to many random states
+
+Run it with FSMD installed, or from the repository root with PYTHONPATH=src:
+
+    python benchmarks/generate.py TOPOLOGY STATES OUTPUT_FILE [SEED]
+"""
+import math
+import random
+import sys
+
+TOPOLOGIES = ("dfa", "nfa", "chain", "grid", "dense")
+ALPHABET = "abcd"
+DENSE_DEGREE = 32
+
+
+def names(states: int):
+    return [f"q_{i}" for i in range(states)]
+
+
+def dfa(rng: random.Random, states: int):
+    q = names(states)
+    return q, [f"{q[i]};{q[rng.randrange(states)]};{a}" for i in range(states) for a in ALPHABET]
+
+
+def nfa(rng: random.Random, states: int):
+    q = names(states)
+    transitions = set()
+    for i in range(states):
+        for _ in range(2):
+            transitions.add(f"{q[i]};{q[rng.randrange(states)]};{rng.choice(ALPHABET)}")
+        if rng.random() < 0.2:
+            transitions.add(f"{q[i]};{q[rng.randrange(states)]};E")
+    return q, sorted(transitions)
+
+
+def chain(rng: random.Random, states: int):
+    q = names(states)
+    return q, [f"{q[i]};{q[i + 1]};a" for i in range(states - 1)]
+
+
+def grid(rng: random.Random, states: int):
+    side = max(1, int(math.sqrt(states)))
+    q = names(side * side)
+    transitions = []
+    for row in range(side):
+        for col in range(side):
+            i = row * side + col
+            if col + 1 < side:
+                transitions.append(f"{q[i]};{q[i + 1]};r")
+            if row + 1 < side:
+                transitions.append(f"{q[i]};{q[i + side]};d")
+    return q, transitions
+
+
+def dense(rng: random.Random, states: int):
+    q = names(states)
+    degree = min(states, DENSE_DEGREE)
+    return q, [
+        f"{q[i]};{q[j]};{ALPHABET[k % len(ALPHABET)]}{k}"
+        for i in range(states)
+        for k, j in enumerate(rng.sample(range(states), degree))
+    ]
+
+
+def generate(topology: str, states: int, seed: int = 0) -> dict:
+    """
+    Returns the data of an FSM file with about states states.
+    """
+    if topology not in TOPOLOGIES:
+        raise ValueError(f"Unknown topology '{topology}', use one of: {', '.join(TOPOLOGIES)}")
+    rng = random.Random(seed)
+    q, transitions = globals()[topology](rng, max(1, states))
+    return {
+        "filename": f"{topology}_{states}",
+        "states": q,
+        "startstate": q[0],
+        "finalstates": [q[i] for i in range(0, len(q), max(1, len(q) // 10))],
+        "transitions": transitions,
+    }
+
+
+def main() -> None:
+    from FSMD.loader import saveFile
+
+    if len(sys.argv) < 4:
+        print(__doc__.strip())
+        sys.exit(1)
+    seed = int(sys.argv[4]) if len(sys.argv) > 4 else 0
+    saveFile(generate(sys.argv[1], int(sys.argv[2]), seed), sys.argv[3])
+
+
+if __name__ == "__main__":
+    main()
@@ -34,8 +34,8 @@ setuptools.setup(
         "rich ==13.5.3",
         "typer ==0.9.0",
         "typing_extensions ==4.8.0",
-        "schema==0.7.5",
     ],
+    extras_require={"fast": ["numpy"]},
     package_dir={"": "src"},
     packages=setuptools.find_packages(where="src"),
     python_requires=">3.7",
@@ -1,5 +1,42 @@
-from FSMD.main import run as Run
+from FSMD.api import build_graph, load, render
+from FSMD.automata import StateLimitException
+from FSMD.dot import DotException, DotTimeout
+from FSMD.model import FSM, FSMException
+from FSMD.options import DiagramOptions
+from FSMD.worker import DotPool
+
+__all__ = [
+    "build_graph",
+    "load",
+    "render",
+    "DiagramOptions",
+    "DotPool",
+    "FSM",
+    "DotException",
+    "DotTimeout",
+    "FSMException",
+    "LoaderException",
+    "StateLimitException",
+    "ValidationException",
+]
+
+# These need yaml, so they are only imported when they are first used.
+LAZY_EXCEPTIONS = {
+    "LoaderException": "FSMD.loader",
+    "ValidationException": "FSMD.validate",
+}
+
+
+def __getattr__(name: str):
+    if name in LAZY_EXCEPTIONS:
+        import importlib
+
+        return getattr(importlib.import_module(LAZY_EXCEPTIONS[name]), name)
+    raise AttributeError(f"module 'FSMD' has no attribute '{name}'")
 
 
 def run():
+    # Imported here so that importing FSMD does not load the CLI.
+    from FSMD.main import run as Run
+
     Run()
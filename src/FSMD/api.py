@@ -0,0 +1,92 @@
+import os
+from typing import TYPE_CHECKING, Optional, Union
+
+from FSMD.diagram import buildDiagram, layoutDiagram
+from FSMD.dot import DotException, parseFormats
+from FSMD.model import FSM
+from FSMD.options import DiagramOptions
+from FSMD.worker import DotPool
+
+if TYPE_CHECKING:
+    import graphviz
+
+# An FSM can be given as a machine, the data of an FSM file, or a path to one.
+FSMInput = Union[FSM, dict, str, "os.PathLike[str]"]
+
+
+def load(fsm: FSMInput, inputFormat: Optional[str] = None) -> Union[FSM, dict]:
+    """
+    Returns a machine as is, or the validated data of an FSM file given as a
+    dict or a path, or a compiled .fsmc file, which is loaded as a machine.
+    Raises a LoaderException if a file can not be read, or a
+    ValidationException listing every problem if the data is invalid.
+    """
+    if isinstance(fsm, FSM):
+        return fsm
+    from FSMD.validate import ValidationException, validateFSM
+
+    if isinstance(fsm, dict):
+        return validateFSM(fsm)
+    from FSMD.compiled import isCompiled, loadCompiled
+    from FSMD.loader import LoaderException, parseFile
+
+    path = os.fspath(fsm)
+    try:
+        if isCompiled(path, inputFormat):
+            return loadCompiled(path)
+        return validateFSM(parseFile(path, inputFormat))
+    except OSError as err:
+        raise LoaderException(f"Could not read {path}: {err.strerror or err}")
+    except ValidationException as vE:
+        vE.locate(path, inputFormat)
+        raise
+
+
+def build_graph(
+    fsm: FSMInput,
+    format: str = "svg",
+    epsilon: bool = False,
+    determinize: bool = False,
+    minimize: bool = False,
+    maxStates: Optional[int] = None,
+    merge: bool = True,
+    engine: str = "dot",
+    inputFormat: Optional[str] = None,
+) -> "graphviz.Digraph":
+    """
+    Builds the graphviz graph for an FSM without rendering it. The options
+    match the ones of the create command.
+    """
+    options = DiagramOptions(epsilon, determinize, minimize, maxStates, merge, engine)
+    return buildDiagram(load(fsm, inputFormat), format, options)
+
+
+def render(
+    fsm: FSMInput,
+    format: str = "svg",
+    epsilon: bool = False,
+    determinize: bool = False,
+    minimize: bool = False,
+    maxStates: Optional[int] = None,
+    merge: bool = True,
+    engine: str = "dot",
+    timeout: Optional[float] = None,
+    pool: Optional[DotPool] = None,
+    inputFormat: Optional[str] = None,
+) -> bytes:
+    """
+    Renders an FSM and returns the diagram, without writing any files.
+
+    Nothing is shared between calls except the given pool, which is thread
+    safe, so render can be called from many threads at once. Without a pool,
+    each call runs its own dot process. Raises an FSMException, a
+    LoaderException or a ValidationException for a bad FSM, and a
+    DotException (or DotTimeout) if dot fails.
+    """
+    formats = parseFormats(format)
+    if len(formats) != 1:
+        raise DotException("render returns a single format, call it once for each")
+    G = build_graph(
+        fsm, formats[0], epsilon, determinize, minimize, maxStates, merge, engine, inputFormat
+    )
+    return layoutDiagram(G, formats, timeout, pool)[formats[0]]
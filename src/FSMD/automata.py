@@ -0,0 +1,308 @@
+from collections import deque
+from typing import Dict, Iterator, List, Optional
+
+from FSMD.model import FSM, FSMException
+
+EPSILON = "E"
+
+
+def splitLabel(label: str) -> List[str]:
+    """
+    Splits a transition label into the symbols it accepts, so a label of
+    'a,b' is two transitions, one on 'a' and one on 'b'.
+    """
+    return [part.strip() for part in label.split(",") if part.strip()]
+
+
+def bits(bitset: int) -> Iterator[int]:
+    """
+    Yields the index of every set bit, lowest first.
+    """
+    while bitset:
+        low = bitset & -bitset
+        yield low.bit_length() - 1
+        bitset ^= low
+
+
+class Automaton:
+    """
+    A machine compiled for running input. Symbols are numbered, and sets of
+    states are integer bitsets, so moving a whole set of NFA states on a
+    symbol is a few integer ORs. Epsilon closures are computed once per state.
+    """
+
+    __slots__ = (
+        "fsm",
+        "symbols",
+        "symbolIndex",
+        "moves",
+        "closures",
+        "start",
+        "accepting",
+        "deterministic",
+    )
+
+    fsm: FSM
+    symbols: List[str]
+    symbolIndex: Dict[str, int]
+    moves: List[Dict[int, int]]
+    closures: List[int]
+    start: int
+    accepting: int
+    deterministic: bool
+
+    def __init__(self, fsm: FSM, epsilon: bool = True) -> None:
+        """
+        Compiles fsm, treating 'E' labels as epsilon moves if epsilon is set.
+        """
+        self.fsm = fsm
+        self.symbols = []
+        self.symbolIndex = {}
+        self.moves = [{} for _ in range(len(fsm))]
+        epsilonMoves = [0] * len(fsm)
+        deterministic = True
+
+        for start, end, label in fsm.transitions():
+            for symbol in splitLabel(label):
+                if epsilon and symbol == EPSILON:
+                    epsilonMoves[start] |= 1 << end
+                    deterministic = False
+                    continue
+                id = self.symbolIndex.get(symbol)
+                if id is None:
+                    id = self.symbolIndex[symbol] = len(self.symbols)
+                    self.symbols.append(symbol)
+                targets = self.moves[start].get(id, 0)
+                if targets and not targets >> end & 1:
+                    deterministic = False
+                self.moves[start][id] = targets | 1 << end
+
+        self.closures = self.computeClosures(epsilonMoves)
+        self.start = self.closures[fsm.start]
+        self.accepting = 0
+        for state in fsm.final:
+            self.accepting |= 1 << state
+        self.deterministic = deterministic
+
+    @staticmethod
+    def computeClosures(epsilonMoves: List[int]) -> List[int]:
+        closures = []
+        for state in range(len(epsilonMoves)):
+            closure = 1 << state
+            stack = [state]
+            while stack:
+                new = epsilonMoves[stack.pop()] & ~closure
+                closure |= new
+                stack.extend(bits(new))
+            closures.append(closure)
+        return closures
+
+    def closure(self, states: int) -> int:
+        result = 0
+        closures = self.closures
+        for state in bits(states):
+            result |= closures[state]
+        return result
+
+    def step(self, states: int, symbol: int) -> int:
+        """
+        Moves a set of states on a symbol, including the epsilon closure.
+        """
+        targets = 0
+        moves = self.moves
+        for state in bits(states):
+            targets |= moves[state].get(symbol, 0)
+        return self.closure(targets) if targets else 0
+
+    def accepts(self, states: int) -> bool:
+        return bool(states & self.accepting)
+
+    def table(self) -> List[List[int]]:
+        """
+        Returns the transition table of a deterministic machine, one row per
+        state and one column per symbol. Missing moves go to an extra dead
+        state, numbered len(fsm), which loops to itself.
+        """
+        if not self.deterministic:
+            raise ValueError("Only a deterministic machine has a transition table")
+        dead = len(self.fsm)
+        rows = []
+        for moves in self.moves:
+            row = [dead] * len(self.symbols)
+            for symbol, targets in moves.items():
+                row[symbol] = targets.bit_length() - 1
+            rows.append(row)
+        rows.append([dead] * len(self.symbols))
+        return rows
+
+
+class StateLimitException(FSMException):
+    "An exception raised when a construction would make more states than allowed"
+
+
+def subscriptName(prefix: str, number: int) -> str:
+    """
+    Names a generated state so it renders with a subscript, like D_1_2 for D₁₂.
+    """
+    return prefix + "".join("_" + digit for digit in str(number))
+
+
+def determinize(
+    automaton: Automaton, maxStates: Optional[int] = None, prefix: str = "D"
+) -> FSM:
+    """
+    Builds the DFA for a machine with the subset construction. Only subsets
+    reachable from the start are built, each subset is an integer bitset, and
+    the epsilon closure of each set of targets is computed once and cached.
+    Raises a StateLimitException if the DFA needs more than maxStates states.
+    """
+    fsm = automaton.fsm
+    dfa = FSM(fsm.name)
+    symbols = automaton.symbols
+    moves = automaton.moves
+    closures: Dict[int, int] = {}
+    index: Dict[int, int] = {automaton.start: 0}
+    subsets = [automaton.start]
+    dfa.start = dfa.addState(subscriptName(prefix, 0))
+
+    done = 0
+    while done < len(subsets):
+        subset = subsets[done]
+        if subset & automaton.accepting:
+            dfa.final.add(done)
+        targets: Dict[int, int] = {}
+        for state in bits(subset):
+            for symbol, moved in moves[state].items():
+                targets[symbol] = targets.get(symbol, 0) | moved
+        for symbol in sorted(targets):
+            moved = targets[symbol]
+            closure = closures.get(moved)
+            if closure is None:
+                closure = closures[moved] = automaton.closure(moved)
+            id = index.get(closure)
+            if id is None:
+                id = index[closure] = len(subsets)
+                if maxStates is not None and id >= maxStates:
+                    raise StateLimitException(
+                        f"The DFA for {fsm.name} has more than {maxStates} states"
+                    )
+                subsets.append(closure)
+                dfa.addState(subscriptName(prefix, id))
+            dfa.addTransition(done, id, symbols[symbol])
+        done += 1
+    return dfa
+
+
+def pruneUnreachable(fsm: FSM) -> FSM:
+    """
+    Removes the states that can not be reached from the start, with a breadth
+    first search over the adjacency lists. State names and order are kept.
+    """
+    reached = bytearray(len(fsm))
+    reached[fsm.start] = 1
+    queue = deque([fsm.start])
+    while queue:
+        for id in fsm.adjacency[queue.popleft()]:
+            end = fsm.dst[id]
+            if not reached[end]:
+                reached[end] = 1
+                queue.append(end)
+    if all(reached):
+        return fsm
+
+    pruned = FSM(fsm.name)
+    newId = {}
+    for state, name in enumerate(fsm.states):
+        if reached[state]:
+            newId[state] = pruned.addState(name)
+    pruned.start = newId[fsm.start]
+    pruned.final = {newId[state] for state in fsm.final if reached[state]}
+    for start, end, label in fsm.transitions():
+        if reached[start]:
+            pruned.addTransition(newId[start], newId[end], label)
+    return pruned
+
+
+def minimize(automaton: Automaton, maxStates: Optional[int] = None) -> FSM:
+    """
+    Returns the minimal DFA for a machine. A non-deterministic machine is
+    determinized first (up to maxStates), unreachable states are pruned, and
+    then Hopcroft's partition refinement merges equivalent states in
+    O(n·k·log n). Missing moves go to an implicit dead state, and states that
+    turn out to be equivalent to it are dropped. Each state that is left keeps
+    the name of the first original state it stands for.
+    """
+    if not automaton.deterministic:
+        automaton = Automaton(determinize(automaton, maxStates), epsilon=False)
+    fsm = pruneUnreachable(automaton.fsm)
+    if fsm is not automaton.fsm:
+        automaton = Automaton(fsm, epsilon=False)
+    n = len(fsm)
+    k = len(automaton.symbols)
+    dead = n
+    table = automaton.table()
+
+    # inverse[symbol][state] lists the states that move to state on symbol.
+    inverse = [[[] for _ in range(n + 1)] for _ in range(k)]
+    for state, row in enumerate(table):
+        for symbol, target in enumerate(row):
+            inverse[symbol][target].append(state)
+
+    final = set(fsm.final)
+    blocks = [b for b in (set(final), set(range(n + 1)) - final) if b]
+    blockOf = [0] * (n + 1)
+    for id, block in enumerate(blocks):
+        for state in block:
+            blockOf[state] = id
+    smallest = min(range(len(blocks)), key=lambda id: len(blocks[id]))
+    waiting = {(smallest, symbol) for symbol in range(k)}
+
+    while waiting:
+        splitter, symbol = waiting.pop()
+        preimage: Dict[int, List[int]] = {}
+        for target in list(blocks[splitter]):
+            for state in inverse[symbol][target]:
+                preimage.setdefault(blockOf[state], []).append(state)
+        for id, states in preimage.items():
+            block = blocks[id]
+            if len(states) == len(block):
+                continue
+            # Move the states that hit the splitter into a new block.
+            newBlock = set(states)
+            block -= newBlock
+            newId = len(blocks)
+            blocks.append(newBlock)
+            for state in newBlock:
+                blockOf[state] = newId
+            smaller = newId if len(newBlock) <= len(block) else id
+            for other in range(k):
+                if (id, other) in waiting:
+                    waiting.add((newId, other))
+                else:
+                    waiting.add((smaller, other))
+
+    deadBlock = blockOf[dead]
+    startBlock = blockOf[fsm.start]
+    reduced = FSM(fsm.name)
+    # Number the blocks by their first state, so names follow the file order.
+    order = sorted(
+        (min(block), id) for id, block in enumerate(blocks) if id != deadBlock
+    )
+    newId = {}
+    for first, id in order:
+        newId[id] = reduced.addState(fsm.states[first])
+    if startBlock == deadBlock:
+        # The machine accepts nothing, leave only the start state.
+        reduced.start = reduced.addState(fsm.states[fsm.start])
+        return reduced
+    reduced.start = newId[startBlock]
+    for first, id in order:
+        if first in final:
+            reduced.final.add(newId[id])
+        for symbol, target in enumerate(table[first]):
+            targetBlock = blockOf[target]
+            if targetBlock != deadBlock:
+                reduced.addTransition(
+                    newId[id], newId[targetBlock], automaton.symbols[symbol]
+                )
+    return reduced
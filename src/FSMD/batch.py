@@ -0,0 +1,162 @@
+import glob
+import os
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Dict, List, Optional, Tuple
+
+from rich import print as Print
+from rich.status import Status
+
+from FSMD.cache import RenderCache
+from FSMD.diagram import buildDiagram, layoutEngine, renderDiagram
+from FSMD.dot import DotException
+from FSMD.loader import EXTENSIONS, LoaderException, loadFSM
+from FSMD.log import writeLog
+from FSMD.model import FSMException
+from FSMD.options import DiagramOptions
+from FSMD.profiling import NULL_PROFILER, Profiler
+from FSMD.svgopt import optimizerFor
+from FSMD.validate import ValidationException
+from FSMD.worker import DotPool
+
+FSM_EXTENSIONS = tuple(EXTENSIONS)
+
+
+def collectFiles(source: str) -> List[str]:
+    """
+    Finds the FSM files for a batch, from either a directory or a glob pattern.
+    """
+    if os.path.isdir(source):
+        files = [
+            os.path.join(source, name)
+            for name in os.listdir(source)
+            if name.lower().endswith(FSM_EXTENSIONS)
+        ]
+    else:
+        files = glob.glob(source, recursive=True)
+    return sorted(f for f in files if os.path.isfile(f))
+
+
+def buildAll(
+    files: List[str],
+    format: str,
+    options: DiagramOptions,
+    inputFormat: Optional[str] = None,
+    profiler: Profiler = NULL_PROFILER,
+):
+    """
+    Validates and builds the graph for every file, returning the graphs that were
+    built and the files that failed along with why.
+    """
+    graphs = []
+    failures: List[Tuple[str, str]] = []
+    for fsmFile in files:
+        try:
+            with profiler.track(fsmFile):
+                data = loadFSM(fsmFile, inputFormat, profiler)
+                graphs.append((fsmFile, buildDiagram(data, format, options, profiler)))
+        except ValidationException as vE:
+            failures.append((fsmFile, "FSM File is Invalid.\n" + vE.message))
+        except (FSMException, LoaderException, DotException) as err:
+            failures.append((fsmFile, err.message))
+        except OSError as err:
+            failures.append((fsmFile, str(err)))
+    return graphs, failures
+
+
+def claimOutputs(graphs) -> Tuple[list, List[Tuple[str, str]]]:
+    """
+    Keeps the first graph for each output name, in file order, and fails the
+    files after it that would write to the same place.
+    """
+    kept = []
+    failures: List[Tuple[str, str]] = []
+    owners: Dict[str, str] = {}
+    for fsmFile, G in graphs:
+        name = os.path.normcase(G.filename)
+        if name in owners:
+            failures.append(
+                (
+                    fsmFile,
+                    f"Has the same filename '{G.filename}' as {owners[name]}, "
+                    "so its diagram would overwrite that one",
+                )
+            )
+            continue
+        owners[name] = fsmFile
+        kept.append((fsmFile, G))
+    return kept, failures
+
+
+def runBatch(
+    source: str,
+    outputDir: str,
+    format: str,
+    jobs: int,
+    options: Optional[DiagramOptions] = None,
+    cache: Optional[RenderCache] = None,
+    inputFormat: Optional[str] = None,
+    profiler: Profiler = NULL_PROFILER,
+) -> bool:
+    """
+    Renders every FSM file found in source into outputDir, using up to jobs
+    warm dot processes at once. Returns False if any of the files failed.
+    """
+    files = collectFiles(source)
+    if not files:
+        Print(f"[red bold]ERROR[/] No FSM files were found in {source}")
+        return False
+
+    startTime = time.perf_counter()
+    spin = Status(f"Creating {len(files)} FSM Diagrams", spinner="dots")
+    spin.start()
+    options = options or DiagramOptions()
+    optimizer = optimizerFor(options.optimize, options.gzip)
+    graphs, failures = buildAll(files, format, options, inputFormat, profiler)
+    graphs, clashes = claimOutputs(graphs)
+    failures += clashes
+
+    rendered = cached = 0
+    engines: Counter = Counter()
+    with DotPool(jobs) as dot, ThreadPoolExecutor(max_workers=jobs) as pool:
+
+        def render(fsmFile: str, G) -> bool:
+            with profiler.track(fsmFile):
+                return renderDiagram(
+                    G, outputDir, format, cache, dot, options.timeout, profiler, optimizer
+                )
+
+        futures = {pool.submit(render, fsmFile, G): (fsmFile, G) for fsmFile, G in graphs}
+        for future in as_completed(futures):
+            fsmFile, G = futures[future]
+            try:
+                wasCached = future.result()
+                cached += wasCached
+                rendered += 1
+                if not wasCached:
+                    engines[layoutEngine(G)] += 1
+                writeLog(f"Rendered {fsmFile} with {layoutEngine(G)}")
+            except Exception as err:
+                failures.append((fsmFile, str(err)))
+    spin.stop()
+    elapsed = time.perf_counter() - startTime
+
+    for fsmFile, reason in sorted(failures):
+        Print(f"[red bold]ERROR[/] {fsmFile}: {reason}")
+        writeLog(f"Failed {fsmFile}: {reason}")
+
+    Print(
+        f"[bold blue]Rendered {rendered}/{len(files)} files to {outputDir} "
+        f"in {elapsed:.2f}s ({len(files) / elapsed:.1f} files/s)[/]"
+        + (f" [dim]({cached} cached)[/]" if cached else "")
+    )
+    if optimizer is not None and optimizer.files:
+        Print(f"[dim]{optimizer.report()}[/]")
+    if engines and (set(engines) != {"dot"} or options.engine != "dot"):
+        Print(
+            "[dim]Laid out with "
+            + ", ".join(f"{engine} ({count})" for engine, count in engines.most_common())
+            + "[/]"
+        )
+    return not failures
@@ -0,0 +1,171 @@
+import hashlib
+import os
+import shutil
+import threading
+from typing import TYPE_CHECKING, BinaryIO, Optional
+
+from FSMD.dot import openAtomic, writeAtomic
+
+if TYPE_CHECKING:
+    import graphviz
+
+CACHE_DIR = os.path.normpath(
+    os.environ.get("FSMD_CACHE_DIR")
+    or os.path.join(os.path.expanduser("~"), ".cache", "FSMD", "renders")
+)
+MAX_SIZE = int(os.environ.get("FSMD_CACHE_SIZE", 256 * 1024 * 1024))
+
+
+class RenderCache:
+    """
+    An on-disk cache of rendered diagrams, keyed by the content of the graph.
+
+    Entries are evicted least recently used first once the cache grows past
+    maxSize bytes. A hit touches the entry, so the mtime is the last use. The
+    total size is read from disk on the first put and kept up to date after
+    that, so the directory is only walked again when it has to be trimmed.
+    """
+
+    directory: str
+    maxSize: int
+    dotVersion: str
+    size: Optional[int]
+
+    def __init__(
+        self, dotVersion: str = "", directory: str = CACHE_DIR, maxSize: int = MAX_SIZE
+    ) -> None:
+        self.dotVersion = dotVersion
+        self.directory = directory
+        self.maxSize = maxSize
+        self.size = None
+        self.lock = threading.Lock()
+
+    def key(
+        self, G: "graphviz.Digraph", format: str, timeout: Optional[float] = None
+    ) -> str:
+        """
+        Hashes everything that affects the output. The DOT source already holds
+        the normalized FSM (subscripts and epsilon applied) and the graph
+        attributes, so only the format and dot version are added to it. A time
+        limit is added too, since a layout that ran out of time is cached as
+        drawn by the fallback engine.
+        """
+        h = hashlib.sha256()
+        limit = "" if timeout is None else f"{timeout:g}"
+        for part in (self.dotVersion, format, limit, G.source):
+            h.update(part.encode("utf-8"))
+            h.update(b"\0")
+        return h.hexdigest()
+
+    def path(self, key: str, format: str) -> str:
+        return os.path.join(self.directory, key[:2], f"{key}.{format}")
+
+    def fetch(self, key: str, format: str, dest: str) -> bool:
+        """
+        Copies the cached artifact to dest, returns False on a cache miss or if
+        it could not be copied. It is a copy rather than a link, so changing
+        dest afterwards can not change the cache.
+        """
+        cached = self.path(key, format)
+        try:
+            with open(cached, "rb") as src, openAtomic(dest) as f:
+                shutil.copyfileobj(src, f)
+        except OSError:
+            return False
+        os.utime(cached)
+        return True
+
+    def open(self, key: str, format: str) -> Optional[BinaryIO]:
+        """
+        Opens a cached artifact for reading, returns None on a cache miss.
+        """
+        cached = self.path(key, format)
+        try:
+            f = open(cached, "rb")
+        except OSError:
+            return None
+        os.utime(cached)
+        return f
+
+    def get(self, key: str, format: str) -> Optional[bytes]:
+        """
+        Reads a cached artifact, returns None on a cache miss.
+        """
+        cached = self.path(key, format)
+        try:
+            with open(cached, "rb") as f:
+                data = f.read()
+        except OSError:
+            return None
+        os.utime(cached)
+        return data
+
+    def put(self, key: str, format: str, data: bytes) -> None:
+        """
+        Adds a freshly rendered artifact to the cache.
+        """
+        writeAtomic(self.path(key, format), data)
+        with self.lock:
+            if self.size is None:
+                self.size = sum(size for _, size, _ in self.entries())
+            else:
+                self.size += len(data)
+            over = self.size > self.maxSize
+        if over:
+            self.evict()
+
+    def entries(self):
+        """
+        Lists the (mtime, size, path) of every artifact in the cache.
+        """
+        found = []
+        if not os.path.isdir(self.directory):
+            return found
+        for root, _, files in os.walk(self.directory):
+            for name in files:
+                if name.endswith(".tmp"):
+                    continue
+                path = os.path.join(root, name)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                found.append((st.st_mtime, st.st_size, path))
+        return found
+
+    def evict(self) -> int:
+        """
+        Removes the least recently used entries until the cache fits in maxSize,
+        returning the number of entries removed.
+        """
+        with self.lock:
+            entries = sorted(self.entries())
+            total = sum(size for _, size, _ in entries)
+            removed = 0
+            for _, size, path in entries:
+                if total <= self.maxSize:
+                    break
+                try:
+                    os.remove(path)
+                except OSError:
+                    continue
+                total -= size
+                removed += 1
+            self.size = total
+            return removed
+
+    def stats(self) -> dict:
+        entries = self.entries()
+        return {
+            "directory": self.directory,
+            "entries": len(entries),
+            "size": sum(size for _, size, _ in entries),
+            "maxSize": self.maxSize,
+        }
+
+    def clear(self) -> int:
+        count = len(self.entries())
+        if os.path.isdir(self.directory):
+            shutil.rmtree(self.directory)
+        self.size = 0
+        return count
@@ -0,0 +1,269 @@
+from typing import List, Optional
+
+from FSMD.automata import Automaton, minimize
+from FSMD.model import FSM, FSMException
+
+LANGUAGES = ("python",)
+# Table rows with more cells than this are wrapped onto several lines.
+PER_LINE = 16
+
+MODULE = '''"""
+A recognizer for the {name} state machine, generated by FSMD codegen{source}.
+Do not edit it by hand, run FSMD codegen again instead.
+
+    match_tokens(tokens)  takes a sequence of symbols{textDoc}{bytesDoc}
+
+Each returns True if the machine accepts the input.
+"""
+from array import array
+
+SYMBOLS = {symbols}
+SYMBOL_INDEX = {{symbol: column for column, symbol in enumerate(SYMBOLS)}}
+# The last column is for anything that is not a symbol.
+OTHER = {other}
+WIDTH = {width}
+START = {start}
+# Missing moves go to DEAD, which never accepts and only moves to itself.
+DEAD = {dead}
+STATES = {states}
+ACCEPT = bytes({accept})
+# TABLE[state * WIDTH + column] is the state moved to.
+TABLE = array(
+    "{typecode}",
+    [
+{table}
+    ],
+)
+
+
+def match_tokens(tokens) -> bool:
+    table = TABLE
+    index = SYMBOL_INDEX
+    width = WIDTH
+    state = START
+    for token in tokens:
+        state = table[state * width + index.get(token, OTHER)]
+        if state == DEAD:
+            return False
+    return ACCEPT[state] == 1
+{textFunctions}'''
+
+TEXT = '''
+
+def match(text: str) -> bool:
+    table = TABLE
+    index = SYMBOL_INDEX
+    width = WIDTH
+    state = START
+    for char in text:
+        state = table[state * width + index.get(char, OTHER)]
+        if state == DEAD:
+            return False
+    return ACCEPT[state] == 1
+'''
+
+BYTES = '''
+
+# Maps each byte to its column, so bytes.translate does the symbol lookups.
+COLUMNS = bytes(SYMBOL_INDEX.get(chr(byte), OTHER) for byte in range(256))
+
+
+def match_bytes(data: bytes) -> bool:
+    table = TABLE
+    width = WIDTH
+    state = START
+    for column in data.translate(COLUMNS):
+        state = table[state * width + column]
+    return ACCEPT[state] == 1
+
+
+def match(text: str) -> bool:
+    try:
+        data = text.encode("ascii")
+    except UnicodeEncodeError:
+        # No symbol is outside ASCII, so the text can not be accepted.
+        return False
+    return match_bytes(data)
+'''
+
+MAIN = '''
+
+if __name__ == "__main__":
+    import sys
+
+    for line in sys.stdin:
+        text = line.rstrip("\\r\\n")
+        sys.stdout.write(("accept" if match(text) else "reject") + "\\t" + text + "\\n")
+'''
+
+TEST = '''"""
+Checks the generated {module} recognizer against FSMD's simulation of the
+machine it was generated from, on random inputs. Run it with pytest or
+python -m unittest, with FSMD installed.
+"""
+import importlib.util
+import os
+import random
+import unittest
+
+from FSMD.automata import Automaton, splitLabel
+from FSMD.model import FSM
+from FSMD.simulate import runStrings
+
+spec = importlib.util.spec_from_file_location(
+    "{name}", os.path.join(os.path.dirname(os.path.abspath(__file__)), "{module}")
+)
+recognizer = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(recognizer)
+
+DATA = {data}
+EPSILON = {epsilon}
+SEED = 0
+CASES = 2000
+MAX_LENGTH = 24
+# Joins tokens for the reference simulation, it is never part of a symbol.
+DELIMITER = "\\x1f"
+
+
+class SelfCheck(unittest.TestCase):
+    def assertSame(self, inputs, actual, expected):
+        # Only the first difference, a diff of thousands of results is unreadable.
+        for given, got, wanted in zip(inputs, actual, expected):
+            if got != wanted:
+                self.fail(f"{{given!r}} gave {{got}}, FSMD gives {{wanted}}")
+        self.assertEqual(len(actual), len(expected))
+
+    @classmethod
+    def setUpClass(cls):
+        fsm = FSM.fromData(DATA)
+        cls.automaton = Automaton(fsm, EPSILON)
+        symbols = list(cls.automaton.symbols)
+        unknown = "?"
+        while unknown in symbols:
+            unknown += "?"
+        rng = random.Random(SEED)
+        cls.inputs = []
+        for case in range(CASES):
+            length = rng.randrange(MAX_LENGTH)
+            if case % 2 and fsm.transitionCount:
+                # A random walk, so accepted inputs are tested as well.
+                tokens = []
+                state = fsm.start
+                for _ in range(length):
+                    moves = [
+                        (end, symbol)
+                        for end, label in fsm.outgoing(state)
+                        for symbol in splitLabel(label)
+                    ]
+                    if not moves:
+                        break
+                    state, symbol = rng.choice(moves)
+                    if not (EPSILON and symbol == "E"):
+                        tokens.append(symbol)
+            else:
+                tokens = [rng.choice(symbols + [unknown]) for _ in range(length)]
+            cls.inputs.append(tokens)
+
+    def test_tokens(self):
+        expected = runStrings(
+            self.automaton, [DELIMITER.join(tokens) for tokens in self.inputs], DELIMITER
+        )
+        actual = [recognizer.match_tokens(tokens) for tokens in self.inputs]
+        self.assertSame(self.inputs, actual, expected)
+
+    @unittest.skipUnless(hasattr(recognizer, "match"), "symbols are not single characters")
+    def test_text(self):
+        texts = ["".join(tokens) for tokens in self.inputs]
+        actual = [recognizer.match(text) for text in texts]
+        self.assertSame(texts, actual, runStrings(self.automaton, texts))
+
+    @unittest.skipUnless(hasattr(recognizer, "match_bytes"), "symbols are not all ASCII")
+    def test_bytes(self):
+        data = ["".join(tokens).encode("utf-8") for tokens in self.inputs]
+        actual = [recognizer.match_bytes(text) for text in data]
+        expected = runStrings(self.automaton, [text.decode("utf-8") for text in data])
+        self.assertSame(data, actual, expected)
+
+
+if __name__ == "__main__":
+    unittest.main()
+'''
+
+
+def checkLanguage(lang: str) -> None:
+    if lang not in LANGUAGES:
+        raise FSMException(f"Unknown language '{lang}', use one of: {', '.join(LANGUAGES)}")
+
+
+def lines(values: List[int], width: int, comments: List[str]) -> str:
+    """
+    Writes a flat table with one row per line, commented with the row's name.
+    Rows wider than PER_LINE are wrapped.
+    """
+    result = []
+    for row, comment in enumerate(comments):
+        cells = values[row * width : (row + 1) * width]
+        for start in range(0, len(cells), PER_LINE):
+            text = ", ".join(str(cell) for cell in cells[start : start + PER_LINE]) + ","
+            result.append(f"        {text}" + (f"  # {comment}" if start == 0 else ""))
+    return "\n".join(result)
+
+
+def generateModule(
+    fsm: FSM,
+    lang: str = "python",
+    epsilon: bool = False,
+    maxStates: Optional[int] = None,
+    source: str = "",
+) -> str:
+    """
+    Returns the source of a standalone recognizer for the machine. The machine
+    is minimized into a DFA first, determinizing it if needed, so matching is
+    one table lookup per symbol. Raises a StateLimitException if the DFA needs
+    more than maxStates states.
+    """
+    checkLanguage(lang)
+    dfa = minimize(Automaton(fsm, epsilon), maxStates)
+    automaton = Automaton(dfa, epsilon=False)
+    symbols = automaton.symbols
+    rows = automaton.table()
+    other = len(symbols)
+    dead = len(dfa)
+    table = []
+    for row in rows:
+        table.extend(row)
+        table.append(dead)
+
+    single = all(len(symbol) == 1 for symbol in symbols)
+    asciiOnly = single and all(ord(symbol) < 128 for symbol in symbols)
+    textFunctions = (BYTES if asciiOnly else TEXT if single else "") + (MAIN if single else "")
+    return MODULE.format(
+        name=dfa.name,
+        source=f" from {source}" if source else "",
+        textDoc="\n    match(text)           takes one symbol per character" if single else "",
+        bytesDoc="\n    match_bytes(data)     takes one symbol per byte" if asciiOnly else "",
+        symbols=repr(tuple(symbols)),
+        other=other,
+        width=other + 1,
+        start=dfa.start,
+        dead=dead,
+        states=repr(tuple(dfa.states)),
+        accept=repr([1 if dfa.isFinal(state) else 0 for state in range(dead + 1)]),
+        typecode="B" if dead < 256 else "H" if dead < 65536 else "i",
+        table=lines(table, other + 1, [repr(name) for name in dfa.states] + ["dead"]),
+        textFunctions=textFunctions,
+    )
+
+
+def generateTest(fsm: FSM, moduleFile: str, lang: str = "python", epsilon: bool = False) -> str:
+    """
+    Returns a test that checks the recognizer in moduleFile, which has to be
+    in the same directory, against FSMD's own simulation of the machine.
+    """
+    checkLanguage(lang)
+    return TEST.format(
+        module=moduleFile,
+        name=moduleFile.rsplit(".", 1)[0],
+        data=repr(fsm.toData()),
+        epsilon=epsilon,
+    )
@@ -0,0 +1,220 @@
+import hashlib
+import mmap
+import os
+import struct
+import sys
+from array import array
+from typing import Optional
+
+from FSMD.dot import writeOutput
+from FSMD.model import FSM, FSMException
+
+EXTENSION = ".fsmc"
+MAGIC = b"FSMC"
+# Bump when the layout changes, so files from other versions are compiled again.
+FORMAT_VERSION = 1
+# magic, version, flags, states, labels, transitions, final states, start state,
+# string table size, source size and mtime, source sha256, body sha256.
+HEADER = struct.Struct("<4sHHIIIIiIQq32s32s")
+ALIGN = 8
+
+
+class CompiledException(FSMException):
+    "An exception raised when a compiled FSM file can not be used"
+
+
+class Slices:
+    """
+    The outgoing transitions of every state, as views into one array that
+    holds them grouped by state.
+    """
+
+    __slots__ = ("starts", "items")
+
+    def __init__(self, starts, items) -> None:
+        self.starts = starts
+        self.items = items
+
+    def __getitem__(self, state: int):
+        return self.items[self.starts[state] : self.starts[state + 1]]
+
+    def __len__(self) -> int:
+        return len(self.starts) - 1
+
+
+def isCompiled(fsmFile: str, inputFormat: Optional[str] = None) -> bool:
+    if inputFormat:
+        return inputFormat == "fsmc"
+    return fsmFile.lower().endswith(EXTENSION)
+
+
+def padding(size: int) -> bytes:
+    return b"\0" * (-size % ALIGN)
+
+
+def compileFSM(fsm: FSM, sourceFile: Optional[str] = None) -> bytes:
+    """
+    Returns the machine in the compiled format. The state names, labels, name
+    and source path go in a NUL separated string table, followed by int32
+    arrays for the transitions, the final states, and the transitions leaving
+    each state. Every section starts on an 8 byte boundary so that it can be
+    used in place from a memory map.
+    """
+    strings = [*fsm.states, *fsm.labels, fsm.name, ""]
+    sourceSize = sourceMtime = 0
+    sourceHash = bytes(32)
+    if sourceFile and sourceFile != "-":
+        strings[-1] = os.path.abspath(sourceFile)
+        stat = os.stat(sourceFile)
+        sourceSize, sourceMtime = stat.st_size, stat.st_mtime_ns
+        sourceHash = fileDigest(sourceFile)
+    for string in strings:
+        if "\0" in string:
+            raise CompiledException(f"'{string}' can not be compiled, it contains a NUL")
+    table = "\0".join(strings).encode("utf-8")
+
+    order = sorted(range(fsm.transitionCount), key=fsm.src.__getitem__)
+    starts = array("i", [0] * (len(fsm) + 1))
+    for start in fsm.src:
+        starts[start + 1] += 1
+    for state in range(len(fsm)):
+        starts[state + 1] += starts[state]
+
+    sections = [table]
+    for values in (fsm.src, fsm.dst, fsm.label, sorted(fsm.final), starts, order):
+        values = array("i", values)
+        if sys.byteorder == "big":
+            values.byteswap()
+        sections.append(values.tobytes())
+    body = b"".join(section + padding(len(section)) for section in sections)
+
+    header = HEADER.pack(
+        MAGIC,
+        FORMAT_VERSION,
+        0,
+        len(fsm),
+        len(fsm.labels),
+        fsm.transitionCount,
+        len(fsm.final),
+        fsm.start,
+        len(table),
+        sourceSize,
+        sourceMtime,
+        sourceHash,
+        hashlib.sha256(body).digest(),
+    )
+    return header + body
+
+
+def saveCompiled(fsm: FSM, fsmFile: str, sourceFile: Optional[str] = None) -> int:
+    """
+    Writes the compiled machine to fsmFile, or stdout if it is '-', returning
+    its size in bytes.
+    """
+    data = compileFSM(fsm, sourceFile)
+    writeOutput(fsmFile, data)
+    return len(data)
+
+
+def fileDigest(path: str) -> bytes:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.digest()
+
+
+def loadCompiled(fsmFile: str, verify: bool = False) -> FSM:
+    """
+    Loads a compiled FSM file, or stdin if fsmFile is '-'. The file is memory
+    mapped, and its integer arrays are used in place rather than copied.
+    """
+    if fsmFile == "-":
+        return readCompiled(sys.stdin.buffer.read(), "stdin", verify)
+    with open(fsmFile, "rb") as f:
+        try:
+            buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            raise CompiledException(f"{fsmFile} is not a compiled FSM file")
+    return readCompiled(buffer, fsmFile, verify)
+
+
+def bodySize(states: int, transitions: int, finals: int, tableSize: int) -> int:
+    "The size of the body that a header with these counts describes"
+    sizes = [tableSize] + [count * 4 for count in (transitions,) * 3]
+    sizes += [finals * 4, (states + 1) * 4, transitions * 4]
+    return sum(size + len(padding(size)) for size in sizes)
+
+
+def readCompiled(buffer, fsmFile: str, verify: bool = False) -> FSM:
+    """
+    Returns the machine in a compiled FSM file's bytes, without validating it
+    again. Raises a CompiledException if the file is from another version of
+    FSMD, is truncated, or is older than the FSM file it was compiled from.
+    Only the header is checked, so that loading does not read every page of
+    the map. With verify, the checksum of the body is checked as well.
+    """
+    view = memoryview(buffer)
+    if len(view) < HEADER.size or bytes(view[:4]) != MAGIC:
+        raise CompiledException(f"{fsmFile} is not a compiled FSM file")
+    (
+        _,
+        version,
+        _,
+        states,
+        labels,
+        transitions,
+        finals,
+        start,
+        tableSize,
+        sourceSize,
+        sourceMtime,
+        sourceHash,
+        bodyHash,
+    ) = HEADER.unpack_from(view)
+    if version != FORMAT_VERSION:
+        raise CompiledException(
+            f"{fsmFile} was compiled by another version of FSMD, run FSMD compile again"
+        )
+    body = view[HEADER.size :]
+    if len(body) != bodySize(states, transitions, finals, tableSize) or (
+        verify and hashlib.sha256(body).digest() != bodyHash
+    ):
+        raise CompiledException(f"{fsmFile} is damaged, run FSMD compile again")
+
+    strings = bytes(body[:tableSize]).decode("utf-8").split("\0")
+    if len(strings) != states + labels + 2:
+        raise CompiledException(f"{fsmFile} is damaged, run FSMD compile again")
+    source = strings[-1]
+    if source and os.path.isfile(source):
+        stat = os.stat(source)
+        if (stat.st_size, stat.st_mtime_ns) != (sourceSize, sourceMtime) and (
+            fileDigest(source) != sourceHash
+        ):
+            raise CompiledException(
+                f"{fsmFile} is out of date, {source} has changed since it was compiled"
+            )
+
+    offset = tableSize + len(padding(tableSize))
+    arrays = []
+    for count in (transitions, transitions, transitions, finals, states + 1, transitions):
+        section = body[offset : offset + count * 4].cast("i")
+        if sys.byteorder == "big":
+            section = array("i", section)
+            section.byteswap()
+        arrays.append(section)
+        offset += count * 4 + len(padding(count * 4))
+    src, dst, label, final, starts, order = arrays
+
+    fsm = FSM(strings[-2])
+    fsm.states = strings[:states]
+    fsm.index = dict(zip(fsm.states, range(states)))
+    fsm.start = start
+    fsm.final = set(final)
+    fsm.labels = strings[states : states + labels]
+    fsm.labelIndex = dict(zip(fsm.labels, range(labels)))
+    fsm.src = src
+    fsm.dst = dst
+    fsm.label = label
+    fsm.adjacency = Slices(starts, order)
+    return fsm
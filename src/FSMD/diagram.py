@@ -0,0 +1,258 @@
+import functools
+import io
+import os
+import re
+from typing import TYPE_CHECKING, Dict, List, Optional, Union
+
+from FSMD.automata import Automaton, determinize, minimize
+from FSMD.cache import RenderCache
+from FSMD.dot import (
+    FALLBACK,
+    DotException,
+    DotTimeout,
+    parseFormats,
+    pickEngine,
+    pipeDotFormats,
+    writeOutput,
+)
+from FSMD.edges import mergeEdges
+from FSMD.model import FSM
+from FSMD.options import DiagramOptions
+from FSMD.profiling import NULL_PROFILER, Profiler
+from FSMD.worker import DotPool
+
+if TYPE_CHECKING:
+    import graphviz
+
+    from FSMD.svgopt import SVGOptimizer
+
+EP = str.maketrans("E", "ε")
+SUB_TRANS = str.maketrans("0123456789T", "₀₁₂₃₄₅₆₇₈₉ₜ")
+
+SUBSCRIPT_PATTERN = re.compile(r"_(\d)")
+
+
+def toSub(match):
+    digit = str(match.group(1))
+    subscripted_digit = digit.translate(SUB_TRANS)
+    return subscripted_digit
+
+
+@functools.lru_cache(maxsize=65536)
+def addSubscripts(name):
+    return SUBSCRIPT_PATTERN.sub(toSub, name)
+
+
+# Adds the inital state.
+def iS(g: "graphviz.Digraph", startingState: str, acceptsEmpty: bool = False):
+    g.node("none", None, shape="point", style="invis")
+    if acceptsEmpty:
+        shapeType = "doubleCircle"
+    else:
+        shapeType = "circle"
+
+    g.node(startingState, shape=shapeType)
+    g.edge("none", startingState)
+
+
+# Adds a state
+def s(g: "graphviz.Digraph", name: str, accepted: bool = False):
+    g.node(name, shape="doublecircle" if accepted else "circle")
+
+
+# Adds an edge
+def e(g: "graphviz.Digraph", start: str, end: str, label: str):
+    g.edge(start, end, label)
+
+
+def newGraph(name: str, format, engine: str = "dot") -> "graphviz.Digraph":
+    """
+    Returns an empty graph with the attributes every diagram shares.
+    """
+    import graphviz
+
+    G = graphviz.Digraph(
+        name,
+        format=format,
+        node_attr={"fontname": "Arial,sans-serif"},
+        edge_attr={"fontname": "Arial,sans-serif"},
+    )
+    G.graph_attr["rankdir"] = "LR"
+    G.graph_attr["size"] = "ideal"
+    G.graph_attr["ratio"] = "auto"
+    G.graph_attr["fontname"] = "Arial,sans-serif"
+    if engine != "dot":
+        G.graph_attr["layout"] = engine
+    return G
+
+
+def buildGraph(
+    fsm: FSM, format, epsilon: bool = False, merge: bool = True, engine: str = "dot"
+) -> "graphviz.Digraph":
+    """
+    Builds the graph for a machine, naming each state and label only once.
+    With merge set, parallel transitions are drawn as one edge. Any engine
+    other than dot is set as the graph's layout attribute.
+    """
+    G = newGraph(fsm.name, format, engine)
+    names = [addSubscripts(state) for state in fsm.states]
+    # Initial State
+    iS(G, names[fsm.start], fsm.isFinal(fsm.start))
+    # Setup Nodes
+    for id, name in enumerate(names):
+        if id != fsm.start:
+            s(G, name, fsm.isFinal(id))
+    # Setup Edges
+    if merge:
+        for start, end, label in mergeEdges(fsm, epsilon):
+            e(G, names[start], names[end], label.translate(EP) if epsilon else label)
+    else:
+        labels = [label.translate(EP) if epsilon else label for label in fsm.labels]
+        for start, end, label in zip(fsm.src, fsm.dst, fsm.label):
+            e(G, names[start], names[end], labels[label])
+    G.filename = fsm.name
+    return G
+
+
+def prepareFSM(fsm: FSM, options: DiagramOptions) -> FSM:
+    """
+    Applies the changes to the machine picked in options, before it is drawn.
+    """
+    if options.minimize:
+        fsm = minimize(Automaton(fsm, options.epsilon), options.maxStates)
+    elif options.determinize:
+        fsm = determinize(Automaton(fsm, options.epsilon), options.maxStates)
+    return fsm
+
+
+def loadModel(
+    data: Union[dict, FSM], options: DiagramOptions, profiler: Profiler = NULL_PROFILER
+) -> FSM:
+    """
+    Returns the machine to draw for the data of a validated FSM file or an
+    FSM, with the changes picked in options applied.
+    """
+    with profiler.span("model"):
+        fsm = data if isinstance(data, FSM) else FSM.fromData(data)
+    if options.determinize or options.minimize:
+        with profiler.span("transform"):
+            fsm = prepareFSM(fsm, options)
+    return fsm
+
+
+def buildDiagram(
+    data: Union[dict, FSM],
+    format,
+    options: Optional[DiagramOptions] = None,
+    profiler: Profiler = NULL_PROFILER,
+) -> "graphviz.Digraph":
+    """
+    Builds the graph for the data of a validated FSM file or an FSM, raising an
+    FSMException if it is invalid. For a list of formats like 'svg,png', the
+    graph's own format is the first.
+    """
+    options = options or DiagramOptions()
+    fsm = loadModel(data, options, profiler)
+    engine = pickEngine(options.engine, len(fsm), fsm.transitionCount)
+    with profiler.span("graph"):
+        return buildGraph(fsm, parseFormats(format)[0], options.epsilon, options.merge, engine)
+
+
+def layoutEngine(G: "graphviz.Digraph") -> str:
+    return G.graph_attr.get("layout", "dot")
+
+
+def layoutDiagram(
+    G: "graphviz.Digraph",
+    formats: List[str],
+    timeout: Optional[float] = None,
+    pool: Optional[DotPool] = None,
+    profiler: Profiler = NULL_PROFILER,
+) -> Dict[str, bytes]:
+    """
+    Renders a graph to every format in formats, laying it out only once.
+    With a timeout, a layout that runs out of time is killed and tried again
+    with a faster engine, changing the layout attribute of G to the engine
+    that was used.
+    """
+    while True:
+        with profiler.span("serialize"):
+            source = G.source
+        try:
+            with profiler.span("dot"):
+                if pool and len(formats) == 1:
+                    return {formats[0]: pool.render(source, formats[0], timeout)}
+                return pipeDotFormats(source, formats, timeout)
+        except DotTimeout:
+            fallback = FALLBACK.get(layoutEngine(G))
+            if fallback is None:
+                raise
+            G.graph_attr["layout"] = fallback
+
+
+def writeDiagram(
+    path: str, format: str, data: bytes, optimizer: Optional["SVGOptimizer"] = None
+) -> None:
+    """
+    Writes a rendered diagram to path, or to stdout if path is '-', passing
+    SVG through the optimizer if there is one.
+    """
+    if optimizer is None or format != "svg":
+        writeOutput(path, data)
+    else:
+        optimizer.optimizeTo(io.BytesIO(data), path)
+
+
+def renderDiagram(
+    G: "graphviz.Digraph",
+    outputDir,
+    format,
+    cache: Optional[RenderCache] = None,
+    pool: Optional[DotPool] = None,
+    timeout: Optional[float] = None,
+    profiler: Profiler = NULL_PROFILER,
+    optimizer: Optional["SVGOptimizer"] = None,
+) -> bool:
+    """
+    Renders a graph into outputDir, or to stdout if outputDir is '-'. Only the
+    final artifact is written, and True is returned if it came from the cache.
+    A pool of warm dot workers is used if one is given and there is no timeout.
+    Several formats can be given as a comma separated list, like 'svg,png',
+    and True is then returned only if every one came from the cache. SVG is
+    passed through the optimizer if one is given, the cache keeps dot's own.
+    """
+    formats = parseFormats(format)
+    if outputDir == "-" and len(formats) > 1:
+        raise DotException("Only one format can be written to stdout")
+    outputs = {
+        format: "-" if outputDir == "-" else os.path.join(outputDir, f"{G.filename}.{format}")
+        for format in formats
+    }
+    missing = []
+    with profiler.span("cache"):
+        # Keys are taken before rendering, since a fallback changes the source of G.
+        keys = {format: cache.key(G, format, timeout) for format in formats} if cache else {}
+        for format in formats:
+            if cache:
+                if optimizer is not None and format == "svg":
+                    # Streamed from the cache file, which keeps dot's own output.
+                    cached = cache.open(keys[format], format)
+                    if cached is not None:
+                        with cached:
+                            optimizer.optimizeTo(cached, outputs[format])
+                        continue
+                elif outputs[format] != "-" and cache.fetch(keys[format], format, outputs[format]):
+                    continue
+                data = cache.get(keys[format], format)
+                if data is not None:
+                    writeDiagram(outputs[format], format, data, optimizer)
+                    continue
+            missing.append(format)
+    if missing:
+        rendered = layoutDiagram(G, missing, timeout, pool, profiler)
+        with profiler.span("write"):
+            for format in missing:
+                writeDiagram(outputs[format], format, rendered[format], optimizer)
+                if cache:
+                    cache.put(keys[format], format, rendered[format])
+    return not missing
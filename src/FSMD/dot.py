@@ -0,0 +1,227 @@
+import contextlib
+import functools
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+from typing import BinaryIO, Dict, Iterator, List, Optional
+
+ENGINES = ("dot", "sfdp", "neato", "osage")
+# The engine to try next when a layout runs out of time, each faster than the last.
+FALLBACK = {"dot": "sfdp", "neato": "sfdp", "sfdp": "osage"}
+# Above either count, auto uses sfdp, since dot's layout grows much faster than
+# linearly in the size of the graph.
+AUTO_MAX_STATES = 500
+AUTO_MAX_EDGES = 2500
+# Remembers the version of the last dot binary that was probed.
+STATE_FILE = os.path.normpath(
+    os.environ.get("FSMD_STATE_FILE")
+    or os.path.join(os.path.expanduser("~"), ".cache", "FSMD", "dot.json")
+)
+
+
+class DotException(Exception):
+    "An exception raised when dot fails to render a diagram"
+
+    def __init__(self, message: str) -> None:
+        self.message = message
+        super().__init__(self.message)
+
+
+class DotTimeout(DotException):
+    "An exception raised when a layout takes longer than its time limit"
+
+
+@functools.lru_cache(maxsize=None)
+def dotPath() -> str:
+    """
+    Returns the absolute path of the dot binary: FSMD_DOT if it is set,
+    otherwise the first dot on the PATH, or in the directory the installer
+    uses on Windows. It is resolved once, so running dot never searches the
+    PATH again.
+    """
+    override = os.environ.get("FSMD_DOT")
+    if override:
+        if not os.path.isfile(override):
+            raise DotException(f"FSMD_DOT is set to {override}, which does not exist")
+        return os.path.abspath(override)
+    search = os.environ.get("PATH", os.defpath)
+    if platform.system() == "Windows" and os.getenv("LOCALAPPDATA"):
+        search += os.pathsep + os.path.join(
+            os.getenv("LOCALAPPDATA"), "CreateFSM", "Graphviz", "bin"
+        )
+    path = shutil.which("dot", path=search)
+    if path is None:
+        raise DotException("dot could not be found")
+    return os.path.abspath(path)
+
+
+@functools.lru_cache(maxsize=None)
+def dotVersion() -> str:
+    """
+    Returns the version of dot. It is only probed when the binary is not the
+    one recorded in the state file, by its path, mtime and size.
+    """
+    path = dotPath()
+    stat = os.stat(path)
+    binary = {"path": path, "mtime": stat.st_mtime_ns, "size": stat.st_size}
+    try:
+        with open(STATE_FILE, encoding="utf-8") as f:
+            state = json.load(f)
+        if {key: state.get(key) for key in binary} == binary:
+            return state["version"]
+    except (OSError, ValueError, AttributeError, KeyError):
+        pass
+    try:
+        result = subprocess.run(
+            [path, "--version"],
+            stderr=subprocess.STDOUT,
+            stdout=subprocess.PIPE,
+            check=True,
+        )
+    except (OSError, subprocess.CalledProcessError) as err:
+        raise DotException(f"dot could not be run: {err}")
+    version = result.stdout.decode(errors="replace").strip()
+    try:
+        writeAtomic(STATE_FILE, json.dumps({**binary, "version": version}).encode("utf-8"))
+    except OSError:
+        pass
+    return version
+
+
+def pickEngine(engine: str, states: int, edges: int) -> str:
+    """
+    Returns the layout engine to use for a graph, picking one from its size
+    when engine is 'auto'.
+    """
+    if engine == "auto":
+        if states <= AUTO_MAX_STATES and edges <= AUTO_MAX_EDGES:
+            return "dot"
+        return "sfdp"
+    if engine not in ENGINES:
+        raise DotException(
+            f"Unknown layout engine '{engine}', use one of: auto, {', '.join(ENGINES)}"
+        )
+    return engine
+
+
+def parseFormats(formats: str) -> List[str]:
+    """
+    Splits a comma separated list of output formats, like 'svg,png,pdf'.
+    """
+    result = []
+    for format in formats.split(","):
+        format = format.strip().lower()
+        if format and format not in result:
+            result.append(format)
+    if not result:
+        raise DotException("No output format was given")
+    return result
+
+
+def runDot(args: List[str], source: str, timeout: Optional[float] = None) -> bytes:
+    """
+    Runs dot with args on DOT source, returning what it wrote to stdout. If dot
+    is still running after timeout seconds it is killed, and a DotTimeout is
+    raised.
+    """
+    try:
+        result = subprocess.run(
+            [dotPath(), *args],
+            input=source.encode("utf-8"),
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+            timeout=timeout,
+        )
+    except subprocess.TimeoutExpired:
+        raise DotTimeout(f"The layout took longer than {timeout:g}s")
+    except OSError as err:
+        raise DotException(f"dot could not be run: {err}")
+    if result.returncode != 0:
+        raise DotException(
+            f"dot exited with status {result.returncode}: "
+            + result.stderr.decode(errors="replace").strip()
+        )
+    return result.stdout
+
+
+def pipeDot(source: str, format: str, timeout: Optional[float] = None) -> bytes:
+    """
+    Renders DOT source by piping it through dot, without touching the disk.
+    """
+    return runDot([f"-T{format}"], source, timeout)
+
+
+def pipeDotFormats(
+    source: str, formats: List[str], timeout: Optional[float] = None
+) -> Dict[str, bytes]:
+    """
+    Renders DOT source to every format in formats with a single dot process,
+    so the layout is only computed once. dot writes each format to its own
+    file in a temporary directory, which is read back and removed.
+    """
+    if len(formats) == 1:
+        return {formats[0]: pipeDot(source, formats[0], timeout)}
+    with tempfile.TemporaryDirectory(prefix="fsmd-") as directory:
+        paths = {format: os.path.join(directory, f"graph.{format}") for format in formats}
+        args = []
+        for format, path in paths.items():
+            args += [f"-T{format}", f"-o{path}"]
+        runDot(args, source, timeout)
+        result = {}
+        for format, path in paths.items():
+            try:
+                with open(path, "rb") as f:
+                    result[format] = f.read()
+            except OSError:
+                raise DotException(f"dot did not write the {format} output")
+    return result
+
+
+@contextlib.contextmanager
+def openAtomic(path: str) -> Iterator[BinaryIO]:
+    """
+    Opens a temporary file next to path for writing, which replaces path in
+    one step once the block exits, so readers never see a partial file.
+    """
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    # Not mkstemp, which makes the file 0600, so the umask applies like open().
+    flags = os.O_CREAT | os.O_EXCL | os.O_WRONLY | getattr(os, "O_BINARY", 0)
+    while True:
+        tmp = os.path.join(directory, f".fsmd-{os.urandom(8).hex()}.tmp")
+        try:
+            fd = os.open(tmp, flags, 0o666)
+            break
+        except FileExistsError:
+            continue
+    try:
+        with os.fdopen(fd, "wb") as f:
+            yield f
+        os.replace(tmp, path)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+
+
+def writeAtomic(path: str, data: bytes) -> None:
+    """
+    Writes data to path in one step, so readers never see a partial file.
+    """
+    with openAtomic(path) as f:
+        f.write(data)
+
+
+def writeOutput(path: str, data: bytes) -> None:
+    """
+    Writes a rendered diagram to path, or to stdout if path is '-'.
+    """
+    if path == "-":
+        sys.stdout.buffer.write(data)
+        sys.stdout.buffer.flush()
+    else:
+        writeAtomic(path, data)
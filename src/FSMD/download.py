@@ -0,0 +1,402 @@
+import hashlib
+import os
+import re
+import shutil
+import struct
+import tempfile
+import zipfile
+import zlib
+from typing import Callable, Optional
+
+import requests
+
+DOWNLOAD_DIR = os.path.normpath(
+    os.environ.get("FSMD_DOWNLOAD_DIR")
+    or os.path.join(os.path.expanduser("~"), ".cache", "FSMD", "downloads")
+)
+CHUNK_SIZE = 64 * 1024
+RETRIES = 3
+TIMEOUT = 30
+
+LOCAL_HEADER = b"PK\x03\x04"
+DESCRIPTOR = b"PK\x07\x08"
+HEADER = struct.Struct("<4sHHHHHIIIHH")
+ZIP64_EXTRA = 0x0001
+SHA256_PATTERN = re.compile(r"[0-9a-fA-F]{64}")
+
+
+class DownloadException(Exception):
+    "An exception raised when an archive can not be downloaded or extracted"
+
+    def __init__(self, message: str) -> None:
+        self.message = message
+        super().__init__(self.message)
+
+
+def fileDigest(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def safeJoin(root: str, name: str) -> str:
+    """
+    Joins an archive member name to root, refusing names that would land
+    outside of it.
+    """
+    parts = name.replace("\\", "/").split("/")
+    if name.startswith(("/", "\\")) or ":" in parts[0] or ".." in parts:
+        raise DownloadException(f"Archive member '{name}' is outside the archive")
+    return os.path.join(root, *[part for part in parts if part])
+
+
+class StreamingUnzip:
+    """
+    Extracts a zip archive from its bytes as they arrive, by reading the local
+    header in front of each member instead of the central directory at the end.
+    Members that can not be read that way (encrypted ones, or stored ones whose
+    size is only given after the data) set supported to False, and the archive
+    has to be extracted with zipfile once it is complete.
+    """
+
+    def __init__(self, dest: str) -> None:
+        self.dest = dest
+        self.buffer = bytearray()
+        self.supported = True
+        self.done = False
+        self.entry: Optional[dict] = None
+        self.descriptor = False
+
+    def feed(self, data: bytes) -> None:
+        if self.done or not self.supported:
+            return
+        self.buffer += data
+        while self.step():
+            pass
+
+    def step(self) -> bool:
+        if self.descriptor:
+            return self.readDescriptor()
+        if self.entry is not None:
+            return self.readData()
+        return self.readHeader()
+
+    def readHeader(self) -> bool:
+        if len(self.buffer) < HEADER.size:
+            return False
+        if self.buffer[:4] != LOCAL_HEADER:
+            # The central directory, which is only needed to find members.
+            self.done = True
+            return False
+        _, _, flags, method, _, _, crc, compressed, _, nameLen, extraLen = HEADER.unpack_from(
+            self.buffer
+        )
+        end = HEADER.size + nameLen + extraLen
+        if len(self.buffer) < end:
+            return False
+        raw = bytes(self.buffer[HEADER.size : HEADER.size + nameLen])
+        name = raw.decode("utf-8" if flags & 0x800 else "cp437")
+        extra = bytes(self.buffer[HEADER.size + nameLen : end])
+        big = zip64Size(extra)
+        if compressed == 0xFFFFFFFF:
+            compressed = big
+        sizeLater = bool(flags & 0x08)
+        if (
+            flags & 0x01
+            or method not in (zipfile.ZIP_STORED, zipfile.ZIP_DEFLATED)
+            or (method == zipfile.ZIP_STORED and sizeLater)
+            or (compressed is None and not sizeLater)
+        ):
+            self.supported = False
+            return False
+        del self.buffer[:end]
+
+        path = safeJoin(self.dest, name)
+        if name.endswith(("/", "\\")):
+            os.makedirs(path, exist_ok=True)
+            out = None
+        else:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            out = open(path, "wb")
+        self.entry = {
+            "name": name,
+            "out": out,
+            "crc": crc,
+            "sizeLater": sizeLater,
+            "zip64": big is not None,
+            "remaining": None if sizeLater else compressed,
+            "inflate": zlib.decompressobj(-15) if method == zipfile.ZIP_DEFLATED else None,
+            "actual": 0,
+        }
+        return True
+
+    def readData(self) -> bool:
+        entry = self.entry
+        remaining = entry["remaining"]
+        chunk = bytes(self.buffer if remaining is None else self.buffer[:remaining])
+        inflate = entry["inflate"]
+        if inflate is not None:
+            try:
+                data = inflate.decompress(chunk)
+            except zlib.error:
+                raise DownloadException(f"Archive member '{entry['name']}' is corrupt")
+            used = len(chunk) - len(inflate.unused_data)
+            finished = inflate.eof
+        else:
+            data = chunk
+            used = len(chunk)
+            finished = False
+        if remaining is not None:
+            remaining -= used
+            entry["remaining"] = remaining
+            finished = finished or remaining == 0
+        del self.buffer[:used]
+        if data:
+            entry["actual"] = zlib.crc32(data, entry["actual"])
+            if entry["out"] is not None:
+                entry["out"].write(data)
+        if not finished:
+            return used > 0
+        if entry["out"] is not None:
+            entry["out"].close()
+        if entry["sizeLater"]:
+            self.descriptor = True
+        else:
+            self.checkCrc(entry["crc"])
+        return True
+
+    def readDescriptor(self) -> bool:
+        sizes = 16 if self.entry["zip64"] else 8
+        signed = self.buffer[:4] == DESCRIPTOR
+        size = 4 + sizes + (4 if signed else 0)
+        if len(self.buffer) < size:
+            return False
+        (crc,) = struct.unpack_from("<I", self.buffer, 4 if signed else 0)
+        del self.buffer[:size]
+        self.descriptor = False
+        self.checkCrc(crc)
+        return True
+
+    def checkCrc(self, crc: int) -> None:
+        entry, self.entry = self.entry, None
+        if entry["actual"] & 0xFFFFFFFF != crc:
+            raise DownloadException(f"Archive member '{entry['name']}' is corrupt")
+
+    def close(self) -> None:
+        if self.entry is not None and self.entry["out"] is not None:
+            self.entry["out"].close()
+
+
+def zip64Size(extra: bytes) -> Optional[int]:
+    """
+    Returns the compressed size from a zip64 extra field, which follows the
+    uncompressed size.
+    """
+    while len(extra) >= 4:
+        kind, size = struct.unpack_from("<HH", extra)
+        if kind == ZIP64_EXTRA and size >= 16:
+            return struct.unpack_from("<Q", extra, 12)[0]
+        extra = extra[4 + size :]
+    return None
+
+
+def readSidecar(path: str) -> Optional[str]:
+    """
+    Returns the checksum from a sha256sum style file, if there is one.
+    """
+    try:
+        with open(path) as f:
+            fields = f.read().split()
+    except OSError:
+        return None
+    return fields[0].lower() if fields else None
+
+
+def fetchChecksum(url: str) -> str:
+    """
+    Returns the SHA-256 published at url, in the format sha256sum writes.
+    """
+    try:
+        r = requests.get(url, timeout=TIMEOUT)
+    except requests.exceptions.RequestException as err:
+        raise DownloadException(f"Could not get the checksum from {url}: {err}")
+    if r.status_code != 200:
+        raise DownloadException(f"Request to {r.url} returned status code {r.status_code}")
+    fields = r.text.split()
+    if not fields or not SHA256_PATTERN.fullmatch(fields[0]):
+        raise DownloadException(f"{url} does not hold a SHA-256 checksum")
+    return fields[0].lower()
+
+
+def extractArchive(archive: str, dest: str) -> None:
+    with zipfile.ZipFile(archive) as zf:
+        for member in zf.infolist():
+            path = safeJoin(dest, member.filename)
+            if member.is_dir():
+                os.makedirs(path, exist_ok=True)
+                continue
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with zf.open(member) as src, open(path, "wb") as out:
+                shutil.copyfileobj(src, out, CHUNK_SIZE)
+
+
+def moveContents(src: str, dest: str) -> None:
+    for name in os.listdir(src):
+        target = os.path.join(dest, name)
+        if os.path.isdir(target):
+            shutil.rmtree(target)
+        elif os.path.exists(target):
+            os.remove(target)
+        os.replace(os.path.join(src, name), target)
+
+
+def download(
+    url: str,
+    directory: str = DOWNLOAD_DIR,
+    sha256: Optional[str] = None,
+    extractTo: Optional[str] = None,
+    progress: Optional[Callable[[int, Optional[int]], None]] = None,
+    checksumUrl: Optional[str] = None,
+) -> str:
+    """
+    Downloads url into directory and returns the path of the archive.
+
+    An archive already in directory is used without the network if it still
+    matches its checksum: sha256 when given, otherwise the one recorded next to
+    it when it was first downloaded. Before downloading, a missing sha256 is
+    fetched from checksumUrl if there is one, so the first download is checked
+    as well. An interrupted download is kept as a .part file, and continued
+    with a Range request on the next attempt or run. With
+    extractTo, the zip is extracted while it downloads, and its contents are
+    only moved into extractTo once the whole archive has been verified.
+    progress is called with the bytes done and the total, if it is known.
+    """
+    os.makedirs(directory, exist_ok=True)
+    name = os.path.basename(url.split("?", 1)[0]) or "download"
+    archive = os.path.join(directory, name)
+    sidecar = archive + ".sha256"
+    expected = sha256.lower() if sha256 else None
+
+    if os.path.isfile(archive):
+        recorded = expected or readSidecar(sidecar)
+        if recorded is not None and fileDigest(archive) == recorded:
+            if progress is not None:
+                size = os.path.getsize(archive)
+                progress(size, size)
+            if extractTo is not None:
+                staging = tempfile.mkdtemp(dir=extractTo)
+                try:
+                    extractArchive(archive, staging)
+                    moveContents(staging, extractTo)
+                finally:
+                    shutil.rmtree(staging, ignore_errors=True)
+            return archive
+        os.remove(archive)
+        if os.path.isfile(sidecar):
+            os.remove(sidecar)
+
+    if expected is None and checksumUrl is not None:
+        expected = fetchChecksum(checksumUrl)
+    part = archive + ".part"
+    staging = tempfile.mkdtemp(dir=extractTo) if extractTo is not None else None
+    try:
+        digest, unzip = resume(url, part, staging, progress)
+        if unzip is not None:
+            unzip.close()
+        actual = digest.hexdigest()
+        if expected is not None and actual != expected:
+            os.remove(part)
+            raise DownloadException(
+                f"Checksum of {name} is {actual}, but {expected} was expected"
+            )
+        os.replace(part, archive)
+        with open(sidecar, "w") as f:
+            f.write(f"{actual}  {name}\n")
+        if staging is not None:
+            if unzip is None or not unzip.done:
+                shutil.rmtree(staging)
+                os.mkdir(staging)
+                extractArchive(archive, staging)
+            moveContents(staging, extractTo)
+    finally:
+        if staging is not None:
+            shutil.rmtree(staging, ignore_errors=True)
+    return archive
+
+
+def resume(url: str, part: str, staging: Optional[str], progress):
+    """
+    Downloads url into part, continuing from the bytes already in it. Returns
+    the sha256 of the whole file, and the extractor it was streamed through.
+    """
+
+    def restart():
+        if staging is not None:
+            shutil.rmtree(staging)
+            os.mkdir(staging)
+        return hashlib.sha256(), StreamingUnzip(staging) if staging is not None else None
+
+    digest, unzip = restart()
+    done = 0
+    with open(part, "ab+") as f:
+        # Bytes from an earlier attempt are hashed and extracted like new ones.
+        f.seek(0)
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+            digest.update(chunk)
+            if unzip is not None:
+                unzip.feed(chunk)
+            done += len(chunk)
+
+        for attempt in range(RETRIES + 1):
+            headers = {"Range": f"bytes={done}-"} if done else {}
+            try:
+                with requests.get(url, headers=headers, stream=True, timeout=TIMEOUT) as r:
+                    if r.status_code == 416 and done:
+                        # Nothing left to send, the part file is complete.
+                        return digest, unzip
+                    if r.status_code == 206:
+                        start = r.headers.get("Content-Range", "").split(" ")[-1].split("-")[0]
+                        if start != str(done):
+                            raise DownloadException(
+                                f"{url} resumed from byte {start} instead of {done}"
+                            )
+                    elif r.status_code == 200:
+                        if done:
+                            f.seek(0)
+                            f.truncate()
+                            done = 0
+                            digest, unzip = restart()
+                    else:
+                        raise DownloadException(
+                            f"Request to {r.url} returned status code {r.status_code}"
+                        )
+                    length = r.headers.get("Content-Length")
+                    total = done + int(length) if length is not None else None
+                    f.seek(0, os.SEEK_END)
+                    for chunk in r.iter_content(CHUNK_SIZE):
+                        f.write(chunk)
+                        digest.update(chunk)
+                        if unzip is not None:
+                            unzip.feed(chunk)
+                        done += len(chunk)
+                        if progress is not None:
+                            progress(done, total)
+                    if total is not None and done < total:
+                        raise requests.exceptions.ChunkedEncodingError(
+                            f"Connection closed after {done} of {total} bytes"
+                        )
+                    return digest, unzip
+            except (
+                requests.exceptions.ConnectionError,
+                requests.exceptions.ChunkedEncodingError,
+                requests.exceptions.Timeout,
+            ) as err:
+                f.flush()
+                if attempt == RETRIES:
+                    raise DownloadException(
+                        f"Download of {url} was interrupted after {done} bytes, "
+                        f"rerun to resume it: {err}"
+                    )
+    return digest, unzip
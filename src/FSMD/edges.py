@@ -0,0 +1,55 @@
+from typing import Dict, Iterator, List, Tuple
+
+from FSMD.automata import EPSILON, splitLabel
+from FSMD.model import FSM
+
+RANGE_DASH = "–"
+MIN_RANGE = 3
+
+
+def compressSymbols(symbols: List[str], epsilon: bool = False) -> str:
+    """
+    Joins symbols into one label, writing runs of at least three consecutive
+    single characters as a range, so a to z is 'a–z'. Single characters come
+    first in code point order, then longer symbols in the order given. With
+    epsilon set, 'E' is never part of a range.
+    """
+    singles = sorted(
+        {s for s in symbols if len(s) == 1 and not (epsilon and s == EPSILON)},
+        key=ord,
+    )
+    parts = []
+    i = 0
+    while i < len(singles):
+        j = i
+        while j + 1 < len(singles) and ord(singles[j + 1]) == ord(singles[j]) + 1:
+            j += 1
+        if j - i + 1 >= MIN_RANGE:
+            parts.append(f"{singles[i]}{RANGE_DASH}{singles[j]}")
+        else:
+            parts.extend(singles[i : j + 1])
+        i = j + 1
+    seen = set(singles)
+    for symbol in symbols:
+        if symbol not in seen:
+            seen.add(symbol)
+            parts.append(symbol)
+    return ",".join(parts)
+
+
+def mergeEdges(fsm: FSM, epsilon: bool = False) -> Iterator[Tuple[int, int, str]]:
+    """
+    Yields one (start, end, label) edge for each pair of states with a
+    transition between them, in the order the pairs first appear. When a pair
+    has more than one symbol, their labels are combined with compressSymbols.
+    """
+    groups: Dict[Tuple[int, int], List[int]] = {}
+    for start, end, label in zip(fsm.src, fsm.dst, fsm.label):
+        groups.setdefault((start, end), []).append(label)
+    labels = fsm.labels
+    for (start, end), ids in groups.items():
+        if len(ids) == 1 and "," not in labels[ids[0]]:
+            yield start, end, labels[ids[0]]
+            continue
+        symbols = [symbol for id in ids for symbol in splitLabel(labels[id])]
+        yield start, end, compressSymbols(symbols, epsilon)
@@ -17,7 +17,11 @@ from rich.padding import Padding
 from rich.status import Status
 from rich.progress import Progress
 
-import requests
+from FSMD.download import DownloadException, download
+
+GRAPHVIZ_URL = "https://gitlab.com/api/v4/projects/4207231/packages/generic/graphviz-releases/9.0.0/windows_10_msbuild_Release_graphviz-9.0.0-win32.zip"
+# The checksum Graphviz publishes beside each release archive.
+GRAPHVIZ_SHA256_URL = GRAPHVIZ_URL + ".sha256"
 
 
 def normPath(path):
@@ -413,64 +417,37 @@ class WindowsInstaller(Installer):
             return False
 
     def DownloadGraphviz(self):
+        """
+        Downloads Graphviz into the download cache and extracts it into the
+        base path as it arrives. A verified archive already in the cache is
+        used without the network, and a partial one is resumed.
+        """
+        url = os.environ.get("FSMD_GRAPHVIZ_URL", GRAPHVIZ_URL)
         try:
-            zipfile = os.path.join(self.basePath, "Graphviz.zip")
-            if os.path.isfile(zipfile):
-                os.remove(zipfile)
-
-            r = requests.get(
-                "https://gitlab.com/api/v4/projects/4207231/packages/generic/graphviz-releases/9.0.0/windows_10_msbuild_Release_graphviz-9.0.0-win32.zip",
-                stream=True,
-            )
-
             with Progress() as progress:
-                task1 = progress.add_task(
-                    "[blue]Downloading Graphviz...",
-                    total=int(r.headers.get("Content-Length", 0)),
+                task1 = progress.add_task("[blue]Downloading Graphviz...", total=None)
+                archive = download(
+                    url,
+                    sha256=os.environ.get("FSMD_GRAPHVIZ_SHA256"),
+                    extractTo=self.basePath,
+                    progress=lambda done, total: progress.update(
+                        task1, completed=done, total=total
+                    ),
+                    checksumUrl=GRAPHVIZ_SHA256_URL if url == GRAPHVIZ_URL else None,
                 )
-                if r.status_code != 200:
-                    raise InstallerException(
-                        f"Request to {r.url} returned status code {r.status_code}"
-                    )
-
-                with open((zipfile), "wb") as f:
-                    for data in r.iter_content(1024):
-                        progress.update(task1, advance=len(data))
-                        f.write(data)
                 progress.stop()
-                print("\033[A\033[2K\r", end="")
-                Installer.printResult(
-                    Result.SUCCESS, "Successfully downloaded Graphviz"
-                )
-                return True
+            print("\033[A\033[2K\r", end="")
+            Print(f"INFO: Graphviz archive at {archive} - " + tStamp(), file=self.log)
+            Installer.printResult(
+                Result.SUCCESS, "Successfully downloaded and extracted Graphviz"
+            )
+            return True
         except Exception as e:
             Installer.printResult(Result.ERROR, "Failed to Download Graphviz")
-            Print("\n[red bold]ERROR[/] Could not download Graphviz archive.")
-            Print(e, file=self.log)
-            return False
-
-    def RemoveZip(self):
-        zipfile = os.path.join(self.basePath, "Graphviz.zip")
-        if os.path.isfile(zipfile):
-            os.remove(zipfile)
-
-    def ExtractGraphviz(self):
-        spin = Status("Extracting Graphviz")
-        spin.start()
-        try:
-            if os.path.exists(normPath(f"{self.basePath}\Graphviz.zip")):
-                shutil.unpack_archive(
-                    normPath(f"{self.basePath}\Graphviz.zip"), self.basePath
-                )
-                spin.stop()
-                Installer.printResult(Result.SUCCESS, "Graphviz was extracted")
-                self.RemoveZip()
-                return True
-            else:
-                raise InstallerException("Graphviz.zip could not be found.")
-        except Exception as e:
-            Installer.printResult(Result.ERROR, "Failed to extract Graphviz")
-            Print("\n[red bold]ERROR[/] Could not extract Graphviz archive.")
+            Print(
+                "\n[red bold]ERROR[/] Could not download Graphviz archive."
+                + (f" {e.message}" if isinstance(e, DownloadException) else "")
+            )
             Print(e, file=self.log)
             return False
 
@@ -478,8 +455,6 @@ class WindowsInstaller(Installer):
         if not self.TestForDot(addBase=True):
             self.initBasePath(self.basePath)
             if self.DownloadGraphviz():
-                if not self.ExtractGraphviz():
-                    self.FinishInstall(1)
                 if not self.TestForDot(addBase=True):
                     self.FinishInstall(1)
                 else:
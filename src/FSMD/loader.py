@@ -0,0 +1,197 @@
+import json
+import os
+import sys
+from typing import Optional, TextIO, Union
+
+import yaml
+
+from FSMD.dot import writeAtomic
+from FSMD.model import FSM
+from FSMD.profiling import NULL_PROFILER, Profiler
+
+# The LibYAML loader is many times faster, but is only there if PyYAML was
+# built against LibYAML.
+SafeLoader = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+SafeDumper = getattr(yaml, "CSafeDumper", yaml.SafeDumper)
+
+INPUT_FORMATS = ("yaml", "json", "text")
+EXTENSIONS = {
+    ".yaml": "yaml",
+    ".yml": "yaml",
+    ".json": "json",
+    ".fsmt": "text",
+    ".fsmc": "fsmc",
+}
+LIST_KEYS = ("states", "finalstates")
+
+
+class LoaderException(Exception):
+    "An exception raised when an FSM file can not be read"
+
+    def __init__(self, message: str) -> None:
+        self.message = message
+        super().__init__(self.message)
+
+
+def detectFormat(fsmFile: str) -> str:
+    """
+    Picks the input format from the file extension, defaulting to YAML.
+    """
+    return EXTENSIONS.get(os.path.splitext(fsmFile)[1].lower(), "yaml")
+
+
+def parseText(stream: TextIO) -> dict:
+    """
+    Parses the compact text format. A header of 'key: value' lines is followed
+    by a '---' line, then one FROM;TO;LABEL transition per line. List values
+    are separated by semicolons, and blank lines or lines starting with '#' are
+    skipped. If the states are not listed, they are taken from the other
+    sections in the order they appear.
+
+        filename: machine
+        startstate: q_0
+        finalstates: q_1;q_2
+        ---
+        q_0;q_1;a
+        q_1;q_2;b
+    """
+    data = {}
+    lineNo = 0
+    for line in stream:
+        lineNo += 1
+        line = line.strip()
+        if not line or line.startswith("#"):
+            continue
+        if line == "---":
+            break
+        key, sep, value = line.partition(":")
+        if not sep:
+            raise LoaderException(f"Line {lineNo}: expected 'key: value' or '---'")
+        key, value = key.strip(), value.strip()
+        if key in LIST_KEYS:
+            data[key] = [v.strip() for v in value.split(";") if v.strip()]
+        else:
+            data[key] = value
+    else:
+        raise LoaderException("Missing the '---' line before the transitions")
+
+    transitions = []
+    append = transitions.append
+    for line in stream:
+        line = line.strip()
+        if line and not line.startswith("#"):
+            append(line)
+    data["transitions"] = transitions
+    data.setdefault("finalstates", [])
+
+    if "states" not in data:
+        seen = {data.get("startstate", ""): None}
+        for edge in transitions:
+            parts = edge.split(";", 2)
+            for state in parts[:2]:
+                seen.setdefault(state, None)
+        for state in data["finalstates"]:
+            seen.setdefault(state, None)
+        seen.pop("", None)
+        data["states"] = list(seen)
+    return data
+
+
+def parseStream(stream: TextIO, inputFormat: str):
+    if inputFormat == "yaml":
+        return yaml.load(stream, Loader=SafeLoader)
+    elif inputFormat == "json":
+        return json.load(stream)
+    elif inputFormat == "text":
+        return parseText(stream)
+    raise LoaderException(
+        f"Unknown input format '{inputFormat}', use one of: {', '.join(INPUT_FORMATS)}"
+    )
+
+
+def parseFile(fsmFile: str, inputFormat: Optional[str] = None):
+    """
+    Parses an FSM file without validating it, or stdin if fsmFile is '-'. The
+    format comes from the file extension unless inputFormat is given.
+    """
+    inputFormat = inputFormat or detectFormat(fsmFile)
+    try:
+        if fsmFile == "-":
+            return parseStream(sys.stdin, inputFormat)
+        with open(fsmFile, "r", encoding="utf-8") as f:
+            return parseStream(f, inputFormat)
+    except (yaml.YAMLError, ValueError) as err:
+        raise LoaderException(f"Could not parse {fsmFile}: {err}")
+
+
+def loadFSM(
+    fsmFile: str, inputFormat: Optional[str] = None, profiler: Profiler = NULL_PROFILER
+) -> Union[FSM, dict]:
+    """
+    Loads and validates an FSM file, or stdin if fsmFile is '-', raising a
+    LoaderException if it can not be read or a ValidationException listing
+    every problem (with line numbers where possible) if it is invalid. A
+    compiled file is loaded as an FSM, since it was validated when compiled.
+    """
+    from FSMD.compiled import isCompiled, loadCompiled
+
+    if isCompiled(fsmFile, inputFormat):
+        with profiler.span("parse"):
+            return loadCompiled(fsmFile)
+    from FSMD.validate import ValidationException, validateFSM
+
+    with profiler.span("parse"):
+        data = parseFile(fsmFile, inputFormat)
+    try:
+        with profiler.span("validate"):
+            return validateFSM(data)
+    except ValidationException as vE:
+        vE.locate(fsmFile, inputFormat)
+        raise
+
+
+def loadMachine(fsmFile: str, inputFormat: Optional[str] = None) -> FSM:
+    data = loadFSM(fsmFile, inputFormat)
+    return data if isinstance(data, FSM) else FSM.fromData(data)
+
+
+def formatText(data: dict) -> str:
+    lines = [
+        f"filename: {data['filename']}",
+        f"states: {';'.join(data['states'])}",
+        f"startstate: {data['startstate']}",
+        f"finalstates: {';'.join(data['finalstates'])}",
+        "---",
+    ]
+    lines.extend(data["transitions"])
+    return "\n".join(lines) + "\n"
+
+
+def saveFile(data: dict, fsmFile: str, outputFormat: Optional[str] = None) -> None:
+    """
+    Writes FSM data to a file, or stdout if fsmFile is '-'. The format comes from
+    the file extension unless outputFormat is given.
+    """
+    outputFormat = outputFormat or detectFormat(fsmFile)
+    if outputFormat == "yaml":
+        text = yaml.dump(
+            data, Dumper=SafeDumper, sort_keys=False, allow_unicode=True, width=1000
+        )
+    elif outputFormat == "json":
+        text = json.dumps(data, indent=2, ensure_ascii=False) + "\n"
+    elif outputFormat == "text":
+        text = formatText(data)
+    elif outputFormat == "fsmc" and fsmFile != "-":
+        from FSMD.compiled import saveCompiled
+        from FSMD.model import FSM
+
+        saveCompiled(FSM.fromData(data), fsmFile)
+        return
+    else:
+        raise LoaderException(
+            f"Unknown format '{outputFormat}', use one of: {', '.join(INPUT_FORMATS)}"
+        )
+    if fsmFile == "-":
+        sys.stdout.write(text)
+    else:
+        writeAtomic(fsmFile, text.encode("utf-8"))
@@ -0,0 +1,24 @@
+import os
+import platform
+import tempfile
+import threading
+
+TEMPDIR = (
+    "/tmp" if platform.system() == "Darwin" else os.path.normpath(tempfile.gettempdir())
+)
+
+log = None
+logLock = threading.Lock()
+
+
+def writeLog(text: str):
+    """
+    Writes to the shared log file, this is safe to call from worker threads.
+    The file is opened on the first write, so commands that never log skip it.
+    """
+    global log
+    with logLock:
+        if log is None:
+            log = open(TEMPDIR + "/.createFSM_log", "w+")
+        print(text, file=log)
+        log.flush()
@@ -1,42 +1,29 @@
-import re
+import contextlib
+import functools
 from typing_extensions import Annotated
 import typer
 
 import sys
 
-from rich.status import Status
 from rich import print as Print
 
-import graphviz
-import platform
-import subprocess
 import os
-import yaml
-import tempfile
-
-from schema import Schema, SchemaError, Regex, Use, Optional
-
-fsmSchema = Schema(
-    {
-        "filename": Use(str),
-        "states": [Regex(r"^[^;]+$")],
-        "startstate": Regex(r"^[^;]+$"),
-        "finalstates": [Regex(r"^[^;]+$")],
-        "transitions": [Regex(r"^[^;]+;[^;]+;[^;]+$")],
-    }
-)
-
-
-from FSMD.install import Installer
-
-TEMPDIR = (
-    "/tmp" if platform.system() == "Darwin" else os.path.normpath(tempfile.gettempdir())
-)
-
-doEps = False
-states = []
-
-log = open(TEMPDIR + "/.createFSM_log", "w+")
+from typing import TYPE_CHECKING, List, Optional
+
+# Only light modules are imported here, so 'FSMD --help' and small renders stay
+# fast. graphviz, yaml, rich's console and the installer (which needs requests)
+# are imported by the functions that use them.
+from FSMD.automata import Automaton, determinize, minimize
+from FSMD.cache import RenderCache
+from FSMD.diagram import buildDiagram, buildGraph, layoutEngine, renderDiagram
+from FSMD.dot import DotException, dotPath, dotVersion, parseFormats, pipeDot, writeOutput
+from FSMD.log import writeLog
+from FSMD.model import FSMException
+from FSMD.options import DiagramOptions
+from FSMD.profiling import NULL_PROFILER, Profiler
+
+if TYPE_CHECKING:
+    from rich.console import Console
 
 app = typer.Typer()
 create_app = typer.Typer()
@@ -45,164 +32,887 @@ app.add_typer(
     name="create",
     help="Creates a diagram, run 'FSMD create --help' for details",
 )
+cache_app = typer.Typer()
+app.add_typer(
+    cache_app,
+    name="cache",
+    help="Manages the render cache, run 'FSMD cache --help' for details",
+)
+
+EpsilonOption = Annotated[
+    bool,
+    typer.Option(
+        "--epsilon",
+        "-E",
+        help="Turns 'E' into epsilon for non-deterministic automata.",
+    ),
+]
+InputFormatOption = Annotated[
+    Optional[str],
+    typer.Option(
+        "--input-format",
+        "-i",
+        help="The input format, 'yaml', 'json', 'text' or 'fsmc'. Defaults to the file extension.",
+    ),
+]
+DeterminizeOption = Annotated[
+    bool,
+    typer.Option(
+        "--determinize", "-D", help="Draws the DFA for a non-deterministic machine."
+    ),
+]
+MinimizeOption = Annotated[
+    bool,
+    typer.Option(
+        "--minimize",
+        "-M",
+        help="Draws the minimal DFA, without unreachable or equivalent states.",
+    ),
+]
+MergeOption = Annotated[
+    bool,
+    typer.Option(
+        "--merge/--no-merge",
+        help="Draws parallel transitions as one edge, with ranges like a–z.",
+    ),
+]
+EngineOption = Annotated[
+    str,
+    typer.Option(
+        "--engine",
+        "-e",
+        help="The layout engine, 'dot', 'sfdp', 'neato', 'osage' or 'auto' to pick from the size.",
+    ),
+]
+TimeoutOption = Annotated[
+    Optional[float],
+    typer.Option(
+        "--timeout",
+        min=0.1,
+        help="Seconds before a layout is stopped and tried with a faster engine.",
+    ),
+]
+OptimizeOption = Annotated[
+    bool,
+    typer.Option(
+        "--optimize",
+        help="Shrinks SVG output: drops comments and titles, rounds coordinates and moves styles into CSS.",
+    ),
+]
+GzipOption = Annotated[
+    bool,
+    typer.Option("--gzip", help="Optimizes SVG output and writes it gzipped, as .svg.gz."),
+]
+SplitOption = Annotated[
+    bool,
+    typer.Option(
+        "--split",
+        help="Draws a large machine as one diagram per group of strongly connected states, with an overview linking them.",
+    ),
+]
+PartSizeOption = Annotated[
+    int,
+    typer.Option("--part-size", min=1, help="The most states in each part of a split diagram."),
+]
+ProfileOption = Annotated[
+    bool,
+    typer.Option(
+        "--profile", help="Prints the wall and CPU time of each phase and the peak memory."
+    ),
+]
+TraceOption = Annotated[
+    Optional[str],
+    typer.Option("--trace", help="Writes the phases as a Chrome or Perfetto trace file."),
+]
+CProfileOption = Annotated[
+    Optional[str],
+    typer.Option("--cprofile", help="Writes cProfile statistics of the run to this file."),
+]
+MaxStatesOption = Annotated[
+    Optional[int],
+    typer.Option(
+        "--max-states", min=1, help="Fails if the DFA would have more states than this."
+    ),
+]
+NoCacheOption = Annotated[
+    bool,
+    typer.Option("--no-cache", help="Always render, ignoring the render cache."),
+]
+FormatOption = Annotated[
+    str,
+    typer.Option(
+        "--format",
+        "-f",
+        help="The output format, like 'svg' or 'png'. Several formats like 'svg,png,pdf' share one layout.",
+    ),
+]
+
+
+@functools.lru_cache(maxsize=None)
+def errConsole() -> "Console":
+    """
+    Returns the console for messages that go to stderr.
+    """
+    from rich.console import Console
 
-EP = str.maketrans("E", "ε")
-SUB_TRANS = str.maketrans("0123456789T", "₀₁₂₃₄₅₆₇₈₉ₜ")
+    return Console(stderr=True)
 
 
-def dotSetup():
-    if platform.system() == "Windows":
-        os.environ["Path"] += ";" + os.join.path(
-            os.getenv("LOCALAPPDATA"), "CreateFSM", "Graphviz", "bin"
+@contextlib.contextmanager
+def profiled(profile: bool, trace: Optional[str], cprofile: Optional[str]):
+    """
+    Yields a profiler if any of the profiling options are set, then prints a
+    summary to stderr and writes the trace and cProfile files asked for.
+    """
+    if not (profile or trace or cprofile):
+        yield NULL_PROFILER
+        return
+    import cProfile
+
+    profiler = Profiler()
+    stats = cProfile.Profile() if cprofile else None
+    profiler.start()
+    if stats:
+        stats.enable()
+    try:
+        yield profiler
+    finally:
+        if stats:
+            stats.disable()
+            stats.dump_stats(cprofile)
+        profiler.stop()
+        printProfile(profiler)
+        if trace:
+            profiler.writeTrace(trace)
+            errConsole().print(f"[dim]Trace written to {trace}[/]")
+
+
+def printProfile(profiler: Profiler) -> None:
+    """
+    Prints the time spent in each phase, and for a batch, in each file.
+    """
+    from rich.table import Table
+
+    summary = profiler.summary()
+    totals: dict = {}
+    for times in summary.values():
+        for phase, (wall, cpu, count) in times.items():
+            total = totals.setdefault(phase, [0.0, 0.0, 0])
+            total[0] += wall
+            total[1] += cpu
+            total[2] += count
+    allWall = sum(wall for wall, _, _ in totals.values()) or 1e-9
+
+    table = Table(title="Profile", title_justify="left")
+    for column in ("Phase", "Wall ms", "CPU ms", "Calls", "Share"):
+        table.add_column(column, justify="left" if column == "Phase" else "right")
+    for phase in profiler.phases():
+        wall, cpu, count = totals[phase]
+        table.add_row(
+            phase, f"{wall * 1000:.1f}", f"{cpu * 1000:.1f}", str(count), f"{wall / allWall:.0%}"
+        )
+    errConsole().print(table)
+
+    if len(summary) > 1:
+        table = Table(title="Per File", title_justify="left")
+        for column in ("File", "Wall ms", "CPU ms", "dot ms", "Slowest"):
+            table.add_column(column, justify="left" if column == "File" else "right")
+        for file, times in sorted(summary.items()):
+            slowest = max(times, key=lambda phase: times[phase][0])
+            table.add_row(
+                os.path.basename(file) or "-",
+                f"{sum(t[0] for t in times.values()) * 1000:.1f}",
+                f"{sum(t[1] for t in times.values()) * 1000:.1f}",
+                f"{times['dot'][0] * 1000:.1f}" if "dot" in times else "-",
+                slowest,
+            )
+        errConsole().print(table)
+    if profiler.peakMemory is not None:
+        errConsole().print(
+            f"[bold magenta]Peak Python memory:[/] {profiler.peakMemory / 1048576:.1f} MiB"
         )
+
+
+def dotSetup() -> str:
+    """
+    Checks that dot can be run, returning its version or an empty string.
+    The message when it can not goes to stderr, so it never mixes with a
+    diagram or machine written to stdout.
+    """
     try:
-        subprocess.run(["dot", "--version"], stderr=log, stdout=log, check=True)
-        return True
-    except Exception as e:
+        version = dotVersion()
+        writeLog(f"{dotPath()}: {version}")
+        return version or "unknown"
+    except DotException as dE:
+        writeLog(dE.message)
         Print(
-            "[red bold]\nDot command could not be found.[/]\nPlease run [bold on black]FSMD install[/] to install GraphViz\nOr view the [link=https://github.com/jaxcksn/FSMD]README[/] for more info."
+            "[red bold]\nDot command could not be found.[/]\nPlease run [bold on black]FSMD install[/] to install GraphViz\nOr view the [link=https://github.com/jaxcksn/FSMD]README[/] for more info.",
+            file=sys.stderr,
         )
-        return False
+        return ""
 
 
-def toSub(match):
-    digit = str(match.group(1))
-    subscripted_digit = digit.translate(SUB_TRANS)
-    return subscripted_digit
+def createDiagram(
+    data,
+    outputDir,
+    format,
+    options: Optional[DiagramOptions] = None,
+    cache: Optional[RenderCache] = None,
+    profiler: Profiler = NULL_PROFILER,
+):
+    from rich.status import Status
 
+    from FSMD.svgopt import optimizerFor
 
-def addSubscripts(name):
-    pattern = r"_(\d)"
-    result = re.sub(pattern, toSub, name)
-    return result
+    toStdout = outputDir == "-"
+    spin = Status(
+        "Creating FSM Diagram",
+        spinner="dots",
+        console=errConsole() if toStdout else None,
+    )
+    spin.start()
+    try:
+        options = options or DiagramOptions()
+        optimizer = optimizerFor(options.optimize, options.gzip)
+        parts = 0
+        if options.split:
+            from FSMD.split import buildSplit, renderSplit
+
+            graphs = buildSplit(data, format, options, profiler, optimizer)
+            G = graphs[0]
+            parts = len(graphs) - 1
+        else:
+            G = buildDiagram(data, format, options, profiler)
+        if parts:
+            cachedParts = renderSplit(
+                graphs, outputDir, format, cache, options.timeout, profiler, optimizer
+            )
+            cached = cachedParts == len(graphs)
+        else:
+            cached = renderDiagram(
+                G,
+                outputDir,
+                format,
+                cache,
+                timeout=options.timeout,
+                profiler=profiler,
+                optimizer=optimizer,
+            )
+    except (FSMException, DotException) as err:
+        spin.stop()
+        Print(f"[red bold]ERROR[/] {err.message}", file=sys.stderr)
+        exit(1)
+    spin.stop()
+    # Only name the engine when it was picked, or a layout fell back to it.
+    engine = layoutEngine(G)
+    showEngine = not parts and not cached and (engine != "dot" or options.engine != "dot")
+    if not toStdout:
+        outputs = [f"{outputDir}/{G.filename}.{f}" for f in parseFormats(format)]
+        if optimizer is not None:
+            outputs = [
+                optimizer.outputPath(path) if path.endswith(".svg") else path
+                for path in outputs
+            ]
+        Print(
+            "[bold blue]File output to: "
+            + ", ".join(outputs)
+            + "[/]"
+            + (
+                f" [dim](overview of {parts} parts, {G.filename}-part1 to "
+                f"{G.filename}-part{parts})[/]"
+                if parts
+                else ""
+            )
+            + (" [dim](cached)[/]" if cached else "")
+            + (
+                f" [dim]({cachedParts} of {parts + 1} cached)[/]"
+                if parts and cachedParts and not cached
+                else ""
+            )
+            + (f" [dim](laid out with {engine})[/]" if showEngine else "")
+        )
+    elif showEngine:
+        errConsole().print(f"[dim]Laid out with {engine}[/]")
+    if optimizer is not None and optimizer.files:
+        if toStdout:
+            errConsole().print(f"[dim]{optimizer.report()}[/]")
+        else:
+            Print(f"[dim]{optimizer.report()}[/]")
+
+
+def createFSM(
+    fsmFile: str,
+    outputDir: str,
+    format: str,
+    options: Optional[DiagramOptions] = None,
+    cache: Optional[RenderCache] = None,
+    inputFormat: Optional[str] = None,
+    profiler: Profiler = NULL_PROFILER,
+):
+    from FSMD.loader import LoaderException, loadFSM
+    from FSMD.validate import ValidationException
 
+    try:
+        with profiler.track(fsmFile):
+            data = loadFSM(fsmFile, inputFormat, profiler)
+    except (LoaderException, FSMException, OSError) as err:
+        Print(f"[bold red]ERROR[/] {getattr(err, 'message', err)}", file=sys.stderr)
+        exit(1)
+    except ValidationException as vE:
+        Print("[bold red]ERROR[/] FSM File is Invalid.\n\n" + vE.message, file=sys.stderr)
+        exit(1)
+    with profiler.track(fsmFile):
+        createDiagram(data, outputDir, format, options, cache, profiler)
 
-# Adds the inital state.
-def iS(g: graphviz.Digraph, startingState: str, acceptsEmpty: bool = False):
-    g.node("none", None, shape="point", style="invis")
-    if acceptsEmpty:
-        shapeType = "doubleCircle"
-    else:
-        shapeType = "circle"
 
-    g.node(startingState, shape=shapeType)
-    states.append(startingState)
-    g.edge("none", startingState)
+@app.command()
+def install():
+    """
+    Runs the automatic installer, only supported by Windows and MacOS
+    """
+    from FSMD.install import Installer
 
+    installer = Installer.getInstaller()
 
-# Adds a state
-def s(g: graphviz.Digraph, name: str, accepted: bool = False):
-    g.node(name, shape="doublecircle" if accepted else "circle")
-    states.append(name)
 
+@create_app.command("svg")
+def svg(
+    input: str,
+    outputdir: str,
+    epsilon: EpsilonOption = False,
+    inputFormat: InputFormatOption = None,
+    noCache: NoCacheOption = False,
+    determinize: DeterminizeOption = False,
+    minimize: MinimizeOption = False,
+    maxStates: MaxStatesOption = None,
+    merge: MergeOption = True,
+    engine: EngineOption = "dot",
+    timeout: TimeoutOption = None,
+    optimize: OptimizeOption = False,
+    gzip: GzipOption = False,
+    split: SplitOption = False,
+    partSize: PartSizeOption = 250,
+    profile: ProfileOption = False,
+    trace: TraceOption = None,
+    cprofile: CProfileOption = None,
+):
+    """
+    Generates an SVG diagram of an FSM from an input file. Use '-' for the input
+    or output directory to read from stdin or write the diagram to stdout.
+    """
+    version = dotSetup()
+    if version:
+        cache = None if noCache else RenderCache(version)
+        options = DiagramOptions(
+            epsilon,
+            determinize,
+            minimize,
+            maxStates,
+            merge,
+            engine,
+            timeout,
+            optimize,
+            gzip,
+            split,
+            partSize,
+        )
+        with profiled(profile, trace, cprofile) as profiler:
+            createFSM(input, outputdir, "svg", options, cache, inputFormat, profiler)
 
-# Adds an edge
-def e(g: graphviz.Digraph, start: str, end: str, label: str):
-    if not start in states or not end in states:
-        Print(
-            f"[red bold]ERROR[/] {start};{end};{label} contains states that are not listed in the states section of the FSM file."
+
+@create_app.command("png")
+def png(
+    input: str,
+    outputdir: str,
+    epsilon: EpsilonOption = False,
+    inputFormat: InputFormatOption = None,
+    noCache: NoCacheOption = False,
+    determinize: DeterminizeOption = False,
+    minimize: MinimizeOption = False,
+    maxStates: MaxStatesOption = None,
+    merge: MergeOption = True,
+    engine: EngineOption = "dot",
+    timeout: TimeoutOption = None,
+    split: SplitOption = False,
+    partSize: PartSizeOption = 250,
+    profile: ProfileOption = False,
+    trace: TraceOption = None,
+    cprofile: CProfileOption = None,
+):
+    """
+    Generates an PNG diagram of an FSM from an input file. Use '-' for the input
+    or output directory to read from stdin or write the diagram to stdout.
+    """
+    version = dotSetup()
+    if version:
+        cache = None if noCache else RenderCache(version)
+        options = DiagramOptions(
+            epsilon,
+            determinize,
+            minimize,
+            maxStates,
+            merge,
+            engine,
+            timeout,
+            split=split,
+            partSize=partSize,
         )
-        raise Exception
-    g.edge(start, end, label.translate(EP) if doEps else label)
+        with profiled(profile, trace, cprofile) as profiler:
+            createFSM(input, outputdir, "png", options, cache, inputFormat, profiler)
 
 
-def createDiagram(data, outputDir, format):
-    spin = Status("Creating FSM Diagram", spinner="dots")
-    spin.start()
-    G = graphviz.Digraph(
-        data["filename"],
-        format=format,
-        node_attr={"fontname": "Arial,sans-serif"},
-        edge_attr={"fontname": "Arial,sans-serif"},
-        directory=sys.argv[2],
-    )
-    G.graph_attr["rankdir"] = "LR"
-    G.graph_attr["size"] = "ideal"
-    G.graph_attr["ratio"] = "auto"
-    G.graph_attr["fontname"] = "Arial,sans-serif"
-    # Initial State
-    iS(
-        G,
-        addSubscripts(str(data["startstate"])),
-        data["startstate"] in data["finalstates"],
-    )
-    # Setup Nodes
-    for state in data["states"]:
-        if state != data["startstate"]:
-            s(G, addSubscripts(str(state)), state in data["finalstates"])
-    # Setup Edges
-    for edge in data["transitions"]:
-        parts = edge.split(";")
-        try:
-            e(G, addSubscripts(parts[0]), addSubscripts(parts[1]), parts[2])
-        except:
-            spin.stop()
-            exit(1)
-    G.filename = data["filename"]
-    G.render(directory=outputDir).replace("\\", "/")
-    spin.stop()
-    Print(f"[bold blue]File output to: {outputDir}/{data['filename']}.{format}[/]")
+@create_app.command("multi")
+def multi(
+    input: str,
+    outputdir: str,
+    format: FormatOption = "svg,png,pdf",
+    epsilon: EpsilonOption = False,
+    inputFormat: InputFormatOption = None,
+    noCache: NoCacheOption = False,
+    determinize: DeterminizeOption = False,
+    minimize: MinimizeOption = False,
+    maxStates: MaxStatesOption = None,
+    merge: MergeOption = True,
+    engine: EngineOption = "dot",
+    timeout: TimeoutOption = None,
+    optimize: OptimizeOption = False,
+    gzip: GzipOption = False,
+    split: SplitOption = False,
+    partSize: PartSizeOption = 250,
+    profile: ProfileOption = False,
+    trace: TraceOption = None,
+    cprofile: CProfileOption = None,
+):
+    """
+    Generates a diagram of an FSM in several formats, parsing the file and laying
+    out the graph only once for all of them.
+    """
+    version = dotSetup()
+    if version:
+        cache = None if noCache else RenderCache(version)
+        options = DiagramOptions(
+            epsilon,
+            determinize,
+            minimize,
+            maxStates,
+            merge,
+            engine,
+            timeout,
+            optimize,
+            gzip,
+            split,
+            partSize,
+        )
+        with profiled(profile, trace, cprofile) as profiler:
+            createFSM(input, outputdir, format, options, cache, inputFormat, profiler)
 
 
-def createFSM(fsmFile: str, outputDir: str, format: str):
-    with open(fsmFile, "r") as f:
-        data = yaml.safe_load(f)
-        try:
-            fsmSchema.validate(data)
-            createDiagram(data, outputDir, format)
-        except SchemaError as sE:
-            Print("[bold red]ERROR[/] FSM File is Invalid.\n\n" + str(sE))
-            exit(1)
+@create_app.command("batch")
+def batch(
+    source: str,
+    outputdir: str,
+    format: FormatOption = "svg",
+    jobs: Annotated[
+        int,
+        typer.Option(
+            "--jobs", "-j", min=1, help="The number of diagrams to render at once."
+        ),
+    ] = os.cpu_count() or 1,
+    epsilon: EpsilonOption = False,
+    inputFormat: InputFormatOption = None,
+    noCache: NoCacheOption = False,
+    determinize: DeterminizeOption = False,
+    minimize: MinimizeOption = False,
+    maxStates: MaxStatesOption = None,
+    merge: MergeOption = True,
+    engine: EngineOption = "dot",
+    timeout: TimeoutOption = None,
+    optimize: OptimizeOption = False,
+    gzip: GzipOption = False,
+    profile: ProfileOption = False,
+    trace: TraceOption = None,
+    cprofile: CProfileOption = None,
+):
+    """
+    Generates diagrams for every FSM file in a directory or glob pattern.
+    """
+    from FSMD.batch import runBatch
+
+    if outputdir == "-":
+        Print("[red bold]ERROR[/] Batches must be written to an output directory.")
+        raise typer.Exit(1)
+    version = dotSetup()
+    if version:
+        cache = None if noCache else RenderCache(version)
+        options = DiagramOptions(
+            epsilon,
+            determinize,
+            minimize,
+            maxStates,
+            merge,
+            engine,
+            timeout,
+            optimize,
+            gzip,
+        )
+        with profiled(profile, trace, cprofile) as profiler:
+            ok = runBatch(
+                source, outputdir, format, jobs, options, cache, inputFormat, profiler
+            )
+        if not ok:
+            raise typer.Exit(1)
 
 
 @app.command()
-def install():
+def watch(
+    inputs: Annotated[List[str], typer.Argument(help="FSM files or directories.")],
+    outputdir: str,
+    format: FormatOption = "svg",
+    epsilon: EpsilonOption = False,
+    inputFormat: InputFormatOption = None,
+    determinize: DeterminizeOption = False,
+    minimize: MinimizeOption = False,
+    maxStates: MaxStatesOption = None,
+    merge: MergeOption = True,
+    engine: EngineOption = "dot",
+    timeout: TimeoutOption = None,
+    optimize: OptimizeOption = False,
+    gzip: GzipOption = False,
+    debounce: Annotated[
+        int,
+        typer.Option(help="Milliseconds to wait for saves to settle before rendering."),
+    ] = 200,
+    poll: Annotated[
+        bool,
+        typer.Option("--poll", help="Check modification times instead of using inotify."),
+    ] = False,
+):
     """
-    Runs the automatic installer, only supported by Windows and MacOS
+    Watches FSM files and re-renders a diagram whenever its content changes.
     """
-    installer = Installer.getInstaller()
+    from FSMD.watch import watchFiles
+
+    version = dotSetup()
+    if version:
+        watchFiles(
+            inputs,
+            outputdir,
+            format,
+            DiagramOptions(
+                epsilon,
+                determinize,
+                minimize,
+                maxStates,
+                merge,
+                engine,
+                timeout,
+                optimize,
+                gzip,
+            ),
+            debounce / 1000,
+            poll,
+            inputFormat,
+        )
 
 
-@create_app.command("svg")
-def svg(
+@app.command("run")
+def runInputs(
     input: str,
-    outputdir: str,
-    epsilon: Annotated[
+    inputs: Annotated[
+        str, typer.Argument(help="A file with one input string per line, or '-'.")
+    ],
+    output: Annotated[
+        str, typer.Option("--output", "-o", help="Where to write the results.")
+    ] = "-",
+    delimiter: Annotated[
+        Optional[str],
+        typer.Option(
+            "--delimiter",
+            "-d",
+            help="Split inputs into symbols on this string instead of by character.",
+        ),
+    ] = None,
+    epsilon: EpsilonOption = False,
+    inputFormat: InputFormatOption = None,
+):
+    """
+    Runs every input string against an FSM, writing 'accept' or 'reject' and the
+    string for each line. Labels like 'a,b' accept either symbol.
+    """
+    import time
+    from FSMD.automata import Automaton
+    from FSMD.loader import LoaderException, loadMachine
+    from FSMD.simulate import simulate
+    from FSMD.validate import ValidationException
+
+    try:
+        fsm = loadMachine(input, inputFormat)
+    except (LoaderException, ValidationException, FSMException, OSError) as err:
+        Print(f"[bold red]ERROR[/] {getattr(err, 'message', err)}", file=sys.stderr)
+        raise typer.Exit(1)
+    automaton = Automaton(fsm, epsilon)
+
+    startTime = time.perf_counter()
+    source = sys.stdin if inputs == "-" else open(inputs, "r", encoding="utf-8")
+    target = sys.stdout if output == "-" else open(output, "w", encoding="utf-8")
+    try:
+        total, accepted, characters = simulate(automaton, source, target, delimiter)
+    finally:
+        if source is not sys.stdin:
+            source.close()
+        if target is not sys.stdout:
+            target.close()
+        else:
+            target.flush()
+    elapsed = max(time.perf_counter() - startTime, 1e-9)
+    errConsole().print(
+        f"[bold blue]{accepted}/{total} accepted[/] [dim]({characters} characters in "
+        f"{elapsed:.2f}s, {characters / elapsed / 1e6:.2f}M characters/s)[/]"
+    )
+
+
+@app.command("determinize")
+def determinizeFSM(
+    input: str,
+    output: Annotated[
+        str,
+        typer.Option(
+            "--output", "-o", help="Where to write the DFA, the format is from its extension."
+        ),
+    ] = "-",
+    epsilon: EpsilonOption = False,
+    inputFormat: InputFormatOption = None,
+    maxStates: MaxStatesOption = None,
+):
+    """
+    Writes the DFA for a non-deterministic FSM as a new FSM file.
+    """
+    from FSMD.loader import LoaderException, loadMachine, saveFile
+    from FSMD.validate import ValidationException
+
+    try:
+        fsm = loadMachine(input, inputFormat)
+        dfa = determinize(Automaton(fsm, epsilon), maxStates)
+        saveFile(dfa.toData(), output)
+    except (LoaderException, ValidationException, FSMException, OSError) as err:
+        Print(f"[bold red]ERROR[/] {getattr(err, 'message', err)}", file=sys.stderr)
+        raise typer.Exit(1)
+    errConsole().print(
+        f"[bold blue]{len(fsm)} states became {len(dfa)} states[/] "
+        f"[dim]({fsm.transitionCount} to {dfa.transitionCount} transitions)[/]"
+    )
+
+
+@app.command("minimize")
+def minimizeFSM(
+    input: str,
+    output: Annotated[
+        str,
+        typer.Option(
+            "--output",
+            "-o",
+            help="Where to write the minimal DFA, the format is from its extension.",
+        ),
+    ] = "-",
+    epsilon: EpsilonOption = False,
+    inputFormat: InputFormatOption = None,
+    maxStates: MaxStatesOption = None,
+    measure: Annotated[
         bool,
         typer.Option(
-            "--epsilon",
-            "-E",
-            help="Turns 'E' into epsilon for non-deterministic automata.",
+            "--measure", help="Renders both machines with dot to time the layouts."
         ),
     ] = False,
 ):
     """
-    Generates an SVG diagram of an FSM from an input file.
+    Writes the minimal DFA for an FSM as a new FSM file, pruning unreachable
+    states and merging equivalent ones.
     """
-    doEps = epsilon
-    if dotSetup():
-        createFSM(input, outputdir, "svg")
+    import time
+    from FSMD.loader import LoaderException, loadMachine, saveFile
+    from FSMD.validate import ValidationException
 
+    try:
+        fsm = loadMachine(input, inputFormat)
+        reduced = minimize(Automaton(fsm, epsilon), maxStates)
+        saveFile(reduced.toData(), output)
+    except (LoaderException, ValidationException, FSMException, OSError) as err:
+        Print(f"[bold red]ERROR[/] {getattr(err, 'message', err)}", file=sys.stderr)
+        raise typer.Exit(1)
+    errConsole().print(
+        f"[bold blue]{len(fsm)} states became {len(reduced)} states[/] "
+        f"[dim]({fsm.transitionCount} to {reduced.transitionCount} transitions)[/]"
+    )
+    if measure and dotSetup():
+        times = []
+        for machine in (fsm, reduced):
+            startTime = time.perf_counter()
+            try:
+                pipeDot(buildGraph(machine, "svg", epsilon).source, "svg")
+            except DotException as dE:
+                Print(f"[bold red]ERROR[/] {dE.message}", file=sys.stderr)
+                raise typer.Exit(1)
+            times.append(time.perf_counter() - startTime)
+        errConsole().print(
+            f"[bold blue]Render time went from {times[0]:.2f}s to {times[1]:.2f}s[/] "
+            f"[dim]({times[0] - times[1]:.2f}s saved)[/]"
+        )
 
-@create_app.command("png")
-def png(
+
+@app.command("compile")
+def compileFSMFile(
     input: str,
-    outputdir: str,
-    epsilon: Annotated[
+    output: Annotated[
+        Optional[str],
+        typer.Option(
+            "--output",
+            "-o",
+            help="Where to write the compiled file, defaults to the input with a .fsmc extension.",
+        ),
+    ] = None,
+    inputFormat: InputFormatOption = None,
+    verify: Annotated[
         bool,
         typer.Option(
-            "--epsilon",
-            "-E",
-            help="Turns 'E' into epsilon for non-deterministic automata.",
+            "--verify",
+            help="Checks the whole of a compiled file against its checksum, instead of compiling.",
         ),
     ] = False,
 ):
     """
-    Generates an PNG diagram of an FSM from an input file.
+    Validates an FSM file and writes it as a compiled .fsmc file, which every
+    command loads without parsing or validating it again.
+    """
+    import time
+    from FSMD.compiled import EXTENSION, loadCompiled, saveCompiled
+    from FSMD.loader import LoaderException, loadMachine
+    from FSMD.validate import ValidationException
+
+    if verify:
+        try:
+            fsm = loadCompiled(input, verify=True)
+        except (FSMException, OSError) as err:
+            Print(f"[bold red]ERROR[/] {getattr(err, 'message', err)}", file=sys.stderr)
+            raise typer.Exit(1)
+        errConsole().print(
+            f"[bold blue]{input} is intact[/] "
+            f"[dim]({len(fsm)} states and {fsm.transitionCount} transitions)[/]"
+        )
+        return
+    if output is None:
+        if input == "-":
+            Print("[bold red]ERROR[/] --output is needed to compile stdin", file=sys.stderr)
+            raise typer.Exit(1)
+        output = os.path.splitext(input)[0] + EXTENSION
+    startTime = time.perf_counter()
+    try:
+        fsm = loadMachine(input, inputFormat)
+        size = saveCompiled(fsm, output, input)
+    except (LoaderException, ValidationException, FSMException, OSError) as err:
+        Print(f"[bold red]ERROR[/] {getattr(err, 'message', err)}", file=sys.stderr)
+        raise typer.Exit(1)
+    errConsole().print(
+        f"[bold blue]Compiled {len(fsm)} states and {fsm.transitionCount} transitions[/] "
+        f"[dim]({size / 1024:.1f} KiB in {time.perf_counter() - startTime:.2f}s)[/]"
+    )
+
+
+@app.command("codegen")
+def codegen(
+    input: str,
+    lang: Annotated[
+        str, typer.Option("--lang", "-l", help="The language to generate, only 'python' for now.")
+    ] = "python",
+    output: Annotated[
+        str, typer.Option("--output", "-o", help="Where to write the recognizer.")
+    ] = "-",
+    test: Annotated[
+        bool,
+        typer.Option(
+            "--test/--no-test",
+            help="Also writes test_<module> next to the recognizer, checking it against FSMD.",
+        ),
+    ] = True,
+    epsilon: EpsilonOption = False,
+    inputFormat: InputFormatOption = None,
+    maxStates: MaxStatesOption = None,
+):
+    """
+    Generates a standalone, table driven recognizer for an FSM, which accepts
+    the same inputs as FSMD run.
+    """
+    from FSMD.codegen import generateModule, generateTest
+    from FSMD.loader import LoaderException, loadMachine
+    from FSMD.validate import ValidationException
+
+    try:
+        fsm = loadMachine(input, inputFormat)
+        module = generateModule(fsm, lang, epsilon, maxStates, os.path.basename(input))
+        writeOutput(output, module.encode("utf-8"))
+        if test and output != "-":
+            directory, moduleFile = os.path.split(output)
+            testFile = os.path.join(directory, "test_" + moduleFile)
+            writeOutput(testFile, generateTest(fsm, moduleFile, lang, epsilon).encode("utf-8"))
+    except (LoaderException, ValidationException, FSMException, OSError) as err:
+        Print(f"[bold red]ERROR[/] {getattr(err, 'message', err)}", file=sys.stderr)
+        raise typer.Exit(1)
+    if output != "-":
+        errConsole().print(
+            f"[bold blue]Generated {output}[/]"
+            + (f" [dim](checked by {testFile})[/]" if test else "")
+        )
+
+
+@app.command()
+def serve(
+    host: Annotated[str, typer.Option(help="The address to listen on.")] = "127.0.0.1",
+    port: Annotated[int, typer.Option("--port", "-p", help="The port to listen on.")] = 8080,
+    workers: Annotated[
+        int, typer.Option("--workers", "-w", min=1, help="The number of warm dot workers.")
+    ] = os.cpu_count() or 1,
+    maxRequests: Annotated[
+        int,
+        typer.Option(
+            "--max-requests", min=1, help="Requests rendered at once, others get a 503."
+        ),
+    ] = 16,
+    cacheSize: Annotated[
+        int,
+        typer.Option("--cache-size", min=0, help="MiB of rendered diagrams kept in memory."),
+    ] = 64,
+    timeout: TimeoutOption = None,
+):
+    """
+    Serves an HTTP API that renders FSM files. POST a YAML or JSON FSM file to
+    /render?format=svg (or png, pdf) to get the diagram back, and GET /metrics
+    for request, latency and cache statistics.
     """
-    doEps = epsilon
+    from FSMD.serve import serveForever
+
     if dotSetup():
-        createFSM(input, outputdir, "png")
+        serveForever(host, port, workers, maxRequests, cacheSize * 1024 * 1024, timeout)
+
+
+@cache_app.command("stats")
+def cacheStats():
+    """
+    Shows the size and location of the render cache.
+    """
+    stats = RenderCache().stats()
+    Print(f"[bold magenta]Directory: [/]{stats['directory']}")
+    Print(f"[bold magenta]Entries: [/]{stats['entries']}")
+    Print(
+        f"[bold magenta]Size: [/]{stats['size'] / 1048576:.1f} MiB"
+        f" of {stats['maxSize'] / 1048576:.1f} MiB"
+    )
+
+
+@cache_app.command("clear")
+def cacheClear():
+    """
+    Removes every diagram from the render cache.
+    """
+    Print(f"[bold blue]Removed {RenderCache().clear()} cached diagrams[/]")
 
 
 def run():
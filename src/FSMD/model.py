@@ -0,0 +1,152 @@
+import sys
+from array import array
+from typing import Dict, Iterator, List, Set, Tuple
+
+
+class FSMException(Exception):
+    "An exception raised when an FSM file can not be turned into a diagram"
+
+    def __init__(self, message: str) -> None:
+        self.message = message
+        super().__init__(self.message)
+
+
+class FSM:
+    """
+    A compact, indexed finite state machine.
+
+    States and labels are interned and numbered in the order they are first
+    seen, transitions are stored as three parallel integer arrays, and each
+    state keeps the indices of its outgoing transitions. Looking up a state
+    is a dict access, so building a machine is linear in its size.
+    """
+
+    __slots__ = (
+        "name",
+        "states",
+        "index",
+        "start",
+        "final",
+        "labels",
+        "labelIndex",
+        "src",
+        "dst",
+        "label",
+        "adjacency",
+    )
+
+    name: str
+    states: List[str]
+    index: Dict[str, int]
+    start: int
+    final: Set[int]
+    labels: List[str]
+    labelIndex: Dict[str, int]
+    src: array
+    dst: array
+    label: array
+    adjacency: List[array]
+
+    def __init__(self, name: str) -> None:
+        self.name = name
+        self.states = []
+        self.index = {}
+        self.start = -1
+        self.final = set()
+        self.labels = []
+        self.labelIndex = {}
+        self.src = array("i")
+        self.dst = array("i")
+        self.label = array("i")
+        self.adjacency = []
+
+    @classmethod
+    def fromData(cls, data: dict) -> "FSM":
+        """
+        Builds a machine from the data of a validated FSM file, raising an
+        FSMException if a transition uses a state that is not listed.
+        """
+        fsm = cls(str(data["filename"]))
+        fsm.start = fsm.addState(str(data["startstate"]))
+        for state in data["states"]:
+            fsm.addState(str(state))
+        for state in data["finalstates"]:
+            fsm.final.add(fsm.addState(str(state)))
+        for edge in data["transitions"]:
+            start, end, label = edge.split(";")
+            if start not in fsm.index or end not in fsm.index:
+                raise FSMException(
+                    f"{edge} contains states that are not listed in the states section of the FSM file."
+                )
+            fsm.addTransition(fsm.index[start], fsm.index[end], label)
+        return fsm
+
+    def toData(self) -> dict:
+        """
+        Returns the machine in the same shape as the data of an FSM file.
+        """
+        return {
+            "filename": self.name,
+            "states": list(self.states),
+            "startstate": self.states[self.start],
+            "finalstates": [self.states[id] for id in sorted(self.final)],
+            "transitions": [
+                f"{self.states[start]};{self.states[end]};{label}"
+                for start, end, label in self.transitions()
+            ],
+        }
+
+    def addState(self, name: str) -> int:
+        """
+        Adds a state if it is new, returning its id either way.
+        """
+        id = self.index.get(name)
+        if id is None:
+            id = len(self.states)
+            name = sys.intern(name)
+            self.states.append(name)
+            self.index[name] = id
+            self.adjacency.append(array("i"))
+        return id
+
+    def addLabel(self, label: str) -> int:
+        id = self.labelIndex.get(label)
+        if id is None:
+            id = len(self.labels)
+            label = sys.intern(label)
+            self.labels.append(label)
+            self.labelIndex[label] = id
+        return id
+
+    def addTransition(self, start: int, end: int, label: str) -> int:
+        id = len(self.src)
+        self.src.append(start)
+        self.dst.append(end)
+        self.label.append(self.addLabel(label))
+        self.adjacency[start].append(id)
+        return id
+
+    def transitions(self) -> Iterator[Tuple[int, int, str]]:
+        """
+        Yields (start, end, label) for every transition, in file order.
+        """
+        labels = self.labels
+        for start, end, label in zip(self.src, self.dst, self.label):
+            yield start, end, labels[label]
+
+    def outgoing(self, state: int) -> Iterator[Tuple[int, str]]:
+        """
+        Yields (end, label) for every transition leaving state.
+        """
+        for id in self.adjacency[state]:
+            yield self.dst[id], self.labels[self.label[id]]
+
+    def isFinal(self, state: int) -> bool:
+        return state in self.final
+
+    def __len__(self) -> int:
+        return len(self.states)
+
+    @property
+    def transitionCount(self) -> int:
+        return len(self.src)
@@ -0,0 +1,22 @@
+from dataclasses import dataclass
+from typing import Optional
+
+
+@dataclass
+class DiagramOptions:
+    """
+    The options for turning an FSM into a diagram, shared by the create,
+    batch and watch commands.
+    """
+
+    epsilon: bool = False
+    determinize: bool = False
+    minimize: bool = False
+    maxStates: Optional[int] = None
+    merge: bool = True
+    engine: str = "dot"
+    timeout: Optional[float] = None
+    optimize: bool = False
+    gzip: bool = False
+    split: bool = False
+    partSize: int = 250
@@ -0,0 +1,147 @@
+import contextlib
+import json
+import os
+import threading
+import time
+import tracemalloc
+from typing import Dict, Iterator, List, NamedTuple, Optional
+
+
+class Span(NamedTuple):
+    name: str
+    file: str
+    thread: int
+    start: float
+    wall: float
+    cpu: float
+
+
+class Profiler:
+    """
+    Records how long each phase of a render takes, in wall and CPU time, along
+    with the peak memory Python allocated. Spans are tagged with the file being
+    worked on by their thread, so a batch can be broken down per file. A
+    disabled profiler records nothing, and is what the render functions use
+    unless they are given one.
+    """
+
+    def __init__(self, enabled: bool = True, memory: bool = True) -> None:
+        self.enabled = enabled
+        self.memory = enabled and memory
+        self.spans: List[Span] = []
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.origin = time.perf_counter()
+        self.peakMemory: Optional[int] = None
+
+    def start(self) -> None:
+        self.origin = time.perf_counter()
+        if self.memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+
+    def stop(self) -> None:
+        if self.memory and tracemalloc.is_tracing():
+            self.peakMemory = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+
+    @contextlib.contextmanager
+    def track(self, file: str) -> Iterator[None]:
+        """
+        Tags the spans recorded by this thread with file, until the block ends.
+        """
+        previous = getattr(self.local, "file", "")
+        self.local.file = file
+        try:
+            yield
+        finally:
+            self.local.file = previous
+
+    @contextlib.contextmanager
+    def span(self, name: str) -> Iterator[None]:
+        if not self.enabled:
+            yield
+            return
+        startTime = time.perf_counter()
+        startCpu = time.thread_time()
+        try:
+            yield
+        finally:
+            span = Span(
+                name,
+                getattr(self.local, "file", ""),
+                threading.get_ident(),
+                startTime - self.origin,
+                time.perf_counter() - startTime,
+                time.thread_time() - startCpu,
+            )
+            with self.lock:
+                self.spans.append(span)
+
+    def summary(self) -> Dict[str, Dict[str, List[float]]]:
+        """
+        Returns the total [wall, cpu, count] of each phase, for each file.
+        """
+        files: Dict[str, Dict[str, List[float]]] = {}
+        for span in self.spans:
+            total = files.setdefault(span.file, {}).setdefault(span.name, [0.0, 0.0, 0])
+            total[0] += span.wall
+            total[1] += span.cpu
+            total[2] += 1
+        return files
+
+    def phases(self) -> List[str]:
+        seen: Dict[str, None] = {}
+        for span in self.spans:
+            seen.setdefault(span.name, None)
+        return list(seen)
+
+    def trace(self) -> dict:
+        """
+        Returns the spans in the Chrome trace event format, which can be opened
+        in chrome://tracing or Perfetto.
+        """
+        pid = os.getpid()
+        threads: Dict[int, int] = {}
+        events = []
+        for span in sorted(self.spans, key=lambda span: span.start):
+            tid = threads.setdefault(span.thread, len(threads) + 1)
+            events.append(
+                {
+                    "name": span.name,
+                    "cat": "FSMD",
+                    "ph": "X",
+                    "ts": round(span.start * 1e6, 3),
+                    "dur": round(span.wall * 1e6, 3),
+                    "pid": pid,
+                    "tid": tid,
+                    "args": {"file": span.file, "cpuMs": round(span.cpu * 1000, 3)},
+                }
+            )
+        for tid in threads.values():
+            events.append(
+                {
+                    "name": "thread_name",
+                    "ph": "M",
+                    "pid": pid,
+                    "tid": tid,
+                    "args": {"name": "main" if tid == 1 else f"worker {tid - 1}"},
+                }
+            )
+        if self.peakMemory is not None:
+            events.append(
+                {
+                    "name": "peak memory",
+                    "ph": "C",
+                    "ts": round((time.perf_counter() - self.origin) * 1e6, 3),
+                    "pid": pid,
+                    "args": {"bytes": self.peakMemory},
+                }
+            )
+        return {"traceEvents": events, "displayTimeUnit": "ms"}
+
+    def writeTrace(self, path: str) -> None:
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.trace(), f)
+
+
+NULL_PROFILER = Profiler(enabled=False)
@@ -0,0 +1,329 @@
+import bisect
+import collections
+import hashlib
+import io
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Optional, Tuple
+from urllib.parse import parse_qs, urlparse
+
+import yaml
+from rich import print as Print
+
+from FSMD.diagram import buildDiagram, layoutDiagram
+from FSMD.dot import DotException, DotTimeout
+from FSMD.loader import INPUT_FORMATS, LoaderException, parseStream
+from FSMD.log import writeLog
+from FSMD.model import FSMException
+from FSMD.options import DiagramOptions
+from FSMD.validate import ValidationException, validateFSM
+from FSMD.worker import DotPool
+
+CONTENT_TYPES = {
+    "svg": "image/svg+xml",
+    "png": "image/png",
+    "pdf": "application/pdf",
+}
+MAX_BODY = 16 * 1024 * 1024
+# The time limit of a render when the server is not given one, so a graph dot
+# can not finish never holds a worker and a request slot for good.
+REQUEST_TIMEOUT = 60.0
+# Upper bounds of the latency histogram buckets, in seconds.
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class RequestError(Exception):
+    "An exception raised when a request can not be answered, with its HTTP status"
+
+    def __init__(self, status: int, message: str) -> None:
+        self.status = status
+        self.message = message
+        super().__init__(self.message)
+
+
+class MemoryCache:
+    """
+    A thread safe LRU cache of rendered diagrams, limited to maxSize bytes.
+    """
+
+    def __init__(self, maxSize: int) -> None:
+        self.maxSize = maxSize
+        self.size = 0
+        self.entries: "collections.OrderedDict[str, bytes]" = collections.OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[bytes]:
+        with self.lock:
+            data = self.entries.get(key)
+            if data is not None:
+                self.entries.move_to_end(key)
+            return data
+
+    def put(self, key: str, data: bytes) -> None:
+        if len(data) > self.maxSize:
+            return
+        with self.lock:
+            old = self.entries.pop(key, None)
+            if old is not None:
+                self.size -= len(old)
+            self.entries[key] = data
+            self.size += len(data)
+            while self.size > self.maxSize:
+                _, evicted = self.entries.popitem(last=False)
+                self.size -= len(evicted)
+
+
+class Metrics:
+    """
+    Counts requests, cache hits and render latency, and formats them in the
+    Prometheus text format for the /metrics endpoint.
+    """
+
+    def __init__(self) -> None:
+        self.lock = threading.Lock()
+        self.requests: Dict[int, int] = collections.Counter()
+        self.hits = 0
+        self.misses = 0
+        self.inFlight = 0
+        self.buckets = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.latencySum = 0.0
+
+    def observe(self, status: int, seconds: float) -> None:
+        with self.lock:
+            self.requests[status] += 1
+            self.buckets[bisect.bisect_left(LATENCY_BUCKETS, seconds)] += 1
+            self.latencySum += seconds
+
+    def cacheResult(self, hit: bool) -> None:
+        with self.lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def format(self, cache: MemoryCache) -> str:
+        with self.lock:
+            lines = [
+                "# TYPE fsmd_requests_total counter",
+                *(
+                    f'fsmd_requests_total{{status="{status}"}} {count}'
+                    for status, count in sorted(self.requests.items())
+                ),
+                "# TYPE fsmd_cache_hits_total counter",
+                f"fsmd_cache_hits_total {self.hits}",
+                "# TYPE fsmd_cache_misses_total counter",
+                f"fsmd_cache_misses_total {self.misses}",
+                "# TYPE fsmd_in_flight gauge",
+                f"fsmd_in_flight {self.inFlight}",
+                "# TYPE fsmd_cache_entries gauge",
+                f"fsmd_cache_entries {len(cache.entries)}",
+                "# TYPE fsmd_cache_bytes gauge",
+                f"fsmd_cache_bytes {cache.size}",
+                "# TYPE fsmd_request_seconds histogram",
+            ]
+            total = 0
+            for bound, count in zip(LATENCY_BUCKETS, self.buckets):
+                total += count
+                lines.append(f'fsmd_request_seconds_bucket{{le="{bound:g}"}} {total}')
+            total += self.buckets[-1]
+            lines.append(f'fsmd_request_seconds_bucket{{le="+Inf"}} {total}')
+            lines.append(f"fsmd_request_seconds_sum {self.latencySum:.6f}")
+            lines.append(f"fsmd_request_seconds_count {total}")
+        return "\n".join(lines) + "\n"
+
+
+class RenderService:
+    """
+    Renders FSM files sent over HTTP. At most maxRequests renders run at once,
+    sharing a pool of warm dot workers, and further requests are turned away
+    instead of queueing without bound. Every render has a time limit, which
+    is REQUEST_TIMEOUT unless timeout is given.
+    """
+
+    def __init__(
+        self,
+        workers: int = 1,
+        maxRequests: int = 8,
+        cacheSize: int = 64 * 1024 * 1024,
+        timeout: Optional[float] = None,
+    ) -> None:
+        self.pool = DotPool(workers)
+        self.slots = threading.BoundedSemaphore(maxRequests)
+        self.cache = MemoryCache(cacheSize)
+        self.metrics = Metrics()
+        self.timeout = REQUEST_TIMEOUT if timeout is None else timeout
+
+    def options(self, query: Dict[str, str]) -> DiagramOptions:
+        def flag(name: str, default: bool = False) -> bool:
+            value = query.get(name)
+            if value is None:
+                return default
+            return value.lower() in ("1", "true", "yes", "on")
+
+        maxStates = query.get("maxStates")
+        try:
+            return DiagramOptions(
+                epsilon=flag("epsilon"),
+                determinize=flag("determinize"),
+                minimize=flag("minimize"),
+                maxStates=int(maxStates) if maxStates else None,
+                merge=flag("merge", True),
+                engine=query.get("engine", "dot"),
+                timeout=self.timeout,
+            )
+        except ValueError:
+            raise RequestError(400, "maxStates must be a number")
+
+    def render(
+        self, body: bytes, query: Dict[str, str], contentType: str
+    ) -> Tuple[bytes, str, bool]:
+        """
+        Renders the FSM in body, returning the diagram, its content type and
+        whether it came from the cache.
+        """
+        format = query.get("format", "svg").lower()
+        if format not in CONTENT_TYPES:
+            raise RequestError(400, f"format must be one of: {', '.join(CONTENT_TYPES)}")
+        inputFormat = query.get("input") or ("json" if "json" in contentType else "yaml")
+        if inputFormat not in INPUT_FORMATS:
+            raise RequestError(400, f"input must be one of: {', '.join(INPUT_FORMATS)}")
+        options = self.options(query)
+
+        # The same file with the same options always renders the same diagram.
+        key = hashlib.sha256(
+            json.dumps([format, inputFormat, sorted(query.items())]).encode("utf-8")
+            + b"\0"
+            + body
+        ).hexdigest()
+        data = self.cache.get(key)
+        self.metrics.cacheResult(data is not None)
+        if data is not None:
+            return data, CONTENT_TYPES[format], True
+
+        try:
+            text = io.StringIO(body.decode("utf-8"))
+            G = buildDiagram(
+                validateFSM(parseStream(text, inputFormat)), format, options
+            )
+        except UnicodeDecodeError:
+            raise RequestError(400, "The FSM file must be UTF-8")
+        except ValidationException as vE:
+            raise RequestError(400, "FSM File is Invalid.\n" + vE.message)
+        except (LoaderException, FSMException, DotException) as err:
+            raise RequestError(400, err.message)
+        except (yaml.YAMLError, ValueError) as err:
+            raise RequestError(400, f"Could not parse the FSM file: {err}")
+        try:
+            data = layoutDiagram(G, [format], self.timeout, self.pool)[format]
+        except DotTimeout as dT:
+            raise RequestError(504, dT.message)
+        except DotException as dE:
+            raise RequestError(500, dE.message)
+        self.cache.put(key, data)
+        return data, CONTENT_TYPES[format], False
+
+    def close(self) -> None:
+        self.pool.close()
+
+
+class RenderHandler(BaseHTTPRequestHandler):
+    server_version = "FSMD"
+    service: RenderService
+
+    def send(self, status: int, body: bytes, contentType: str, cached: bool = False):
+        self.send_response(status)
+        self.send_header("Content-Type", contentType)
+        self.send_header("Content-Length", str(len(body)))
+        if status == 200 and contentType in CONTENT_TYPES.values():
+            self.send_header("X-FSMD-Cache", "hit" if cached else "miss")
+        self.end_headers()
+        self.wfile.write(body)
+
+    def sendError(self, status: int, message: str) -> None:
+        self.send(status, (message + "\n").encode("utf-8"), "text/plain; charset=utf-8")
+
+    def do_GET(self) -> None:
+        path = urlparse(self.path).path
+        if path == "/metrics":
+            text = self.service.metrics.format(self.service.cache)
+            self.send(200, text.encode("utf-8"), "text/plain; version=0.0.4")
+        elif path == "/health":
+            self.send(200, b"ok\n", "text/plain; charset=utf-8")
+        else:
+            self.sendError(404, "Not found, POST an FSM file to /render")
+
+    def do_POST(self) -> None:
+        startTime = time.perf_counter()
+        status = 200
+        url = urlparse(self.path)
+        service = self.service
+        if url.path != "/render" or not service.slots.acquire(blocking=False):
+            if url.path != "/render":
+                status = 404
+                self.sendError(status, "Not found, POST an FSM file to /render")
+            else:
+                status = 503
+                self.sendError(status, "Too many requests are being rendered, try again")
+            service.metrics.observe(status, time.perf_counter() - startTime)
+            return
+        with service.metrics.lock:
+            service.metrics.inFlight += 1
+        try:
+            header = self.headers.get("Content-Length")
+            if header is None:
+                raise RequestError(411, "A Content-Length header is required")
+            try:
+                length = int(header)
+            except ValueError:
+                raise RequestError(400, "Content-Length must be a number")
+            if length < 0:
+                raise RequestError(400, "Content-Length can not be negative")
+            if length > MAX_BODY:
+                raise RequestError(413, f"The FSM file is larger than {MAX_BODY} bytes")
+            body = self.rfile.read(length)
+            query = {key: values[-1] for key, values in parse_qs(url.query).items()}
+            data, contentType, cached = service.render(
+                body, query, self.headers.get("Content-Type", "")
+            )
+            self.send(status, data, contentType, cached)
+        except RequestError as rE:
+            status = rE.status
+            self.sendError(status, rE.message)
+        finally:
+            with service.metrics.lock:
+                service.metrics.inFlight -= 1
+            service.slots.release()
+            service.metrics.observe(status, time.perf_counter() - startTime)
+
+    def log_message(self, format: str, *args) -> None:
+        writeLog("serve: " + format % args)
+
+
+def serveForever(
+    host: str = "127.0.0.1",
+    port: int = 8080,
+    workers: int = 1,
+    maxRequests: int = 8,
+    cacheSize: int = 64 * 1024 * 1024,
+    timeout: Optional[float] = None,
+) -> None:
+    """
+    Serves the render API until interrupted.
+    """
+    service = RenderService(workers, maxRequests, cacheSize, timeout)
+    handler = type("Handler", (RenderHandler,), {"service": service})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    Print(
+        f"[bold magenta]Serving FSM diagrams on http://{host}:{server.server_port}[/] "
+        f"[dim]({workers} dot workers, {maxRequests} requests at once)[/]"
+    )
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.close()
@@ -0,0 +1,171 @@
+from typing import Dict, Iterable, Iterator, List, Optional, TextIO, Tuple
+
+from FSMD.automata import Automaton
+
+try:
+    import numpy as np
+except ImportError:  # numpy is an optional extra, pure Python is used without it
+    np = None
+
+CHUNK_SIZE = 65536
+
+
+def readInputs(stream: TextIO, chunkSize: int = CHUNK_SIZE) -> Iterator[List[str]]:
+    """
+    Reads one input string per line, yielding them in chunks so a large corpus
+    is never held in memory at once. An empty line is the empty string.
+    """
+    chunk = []
+    for line in stream:
+        chunk.append(line.rstrip("\r\n"))
+        if len(chunk) >= chunkSize:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+class Simulator:
+    """
+    Runs many input strings against a compiled machine. Each string is read
+    one character at a time, or split on delimiter when one is given.
+
+    A deterministic machine with numpy installed is run as a dense state by
+    symbol table, stepping every string of a chunk at once per position.
+    Otherwise strings are run one at a time, and sets of NFA states are
+    bitsets, with each (set, symbol) move cached once it has been computed.
+    """
+
+    def __init__(self, automaton: Automaton, delimiter: Optional[str] = None) -> None:
+        self.automaton = automaton
+        self.delimiter = delimiter
+        self.cache: Dict[Tuple[int, int], int] = {}
+        self.vectorized = np is not None and automaton.deterministic
+        if self.vectorized:
+            table = automaton.table()
+            dead = len(table) - 1
+            # An extra column for symbols the machine does not know.
+            self.table = np.array([row + [dead] for row in table], dtype=np.int32)
+            self.accept = np.zeros(len(table), dtype=bool)
+            for state in automaton.fsm.final:
+                self.accept[state] = True
+            single = [s for s in automaton.symbols if len(s) == 1]
+            self.codepoints = np.array(sorted(ord(s) for s in single), dtype=np.uint32)
+            self.codeSymbols = np.array(
+                [automaton.symbolIndex[chr(c)] for c in self.codepoints.tolist()],
+                dtype=np.int32,
+            )
+
+    def tokens(self, text: str) -> List[str]:
+        if self.delimiter is None:
+            return list(text)
+        return [token for token in text.split(self.delimiter) if token]
+
+    def run(self, strings: List[str]) -> List[bool]:
+        """
+        Returns whether each string is accepted.
+        """
+        if self.vectorized:
+            return self.runTable(strings)
+        return [self.runOne(text) for text in strings]
+
+    def runOne(self, text: str) -> bool:
+        automaton = self.automaton
+        symbolIndex = automaton.symbolIndex
+        cache = self.cache
+        states = automaton.start
+        for token in self.tokens(text):
+            symbol = symbolIndex.get(token)
+            if symbol is None:
+                return False
+            key = (states, symbol)
+            moved = cache.get(key)
+            if moved is None:
+                moved = cache[key] = automaton.step(states, symbol)
+            if not moved:
+                return False
+            states = moved
+        return automaton.accepts(states)
+
+    def encode(self, strings: List[str]):
+        """
+        Turns a chunk of strings into one flat array of symbol ids, plus the
+        offset and length of each string in it.
+        """
+        unknown = len(self.automaton.symbols)
+        if self.delimiter is None:
+            lengths = np.fromiter((len(s) for s in strings), np.int64, len(strings))
+            codes = np.frombuffer("".join(strings).encode("utf-32-le"), dtype=np.uint32)
+            pos = np.searchsorted(self.codepoints, codes)
+            pos[pos == len(self.codepoints)] = 0
+            if len(self.codepoints):
+                symbols = np.where(
+                    self.codepoints[pos] == codes, self.codeSymbols[pos], unknown
+                ).astype(np.int32)
+            else:
+                symbols = np.full(len(codes), unknown, dtype=np.int32)
+        else:
+            symbolIndex = self.automaton.symbolIndex
+            tokenized = [self.tokens(s) for s in strings]
+            lengths = np.fromiter((len(t) for t in tokenized), np.int64, len(strings))
+            symbols = np.fromiter(
+                (symbolIndex.get(t, unknown) for tokens in tokenized for t in tokens),
+                np.int32,
+                int(lengths.sum()),
+            )
+        offsets = np.zeros(len(strings), dtype=np.int64)
+        np.cumsum(lengths[:-1], out=offsets[1:])
+        return symbols, offsets, lengths
+
+    def runTable(self, strings: List[str]) -> List[bool]:
+        if not strings:
+            return []
+        symbols, offsets, lengths = self.encode(strings)
+        # Longest strings first, so the strings still running are a prefix.
+        order = np.argsort(-lengths, kind="stable")
+        offsets = offsets[order]
+        remaining = lengths[order]
+        current = np.full(len(strings), self.automaton.fsm.start, dtype=np.int32)
+        table = self.table
+        active = len(strings)
+        for position in range(int(remaining[0]) if len(remaining) else 0):
+            while active and remaining[active - 1] <= position:
+                active -= 1
+            current[:active] = table[
+                current[:active], symbols[offsets[:active] + position]
+            ]
+        accepted = np.empty(len(strings), dtype=bool)
+        accepted[order] = self.accept[current]
+        return accepted.tolist()
+
+
+def simulate(
+    automaton: Automaton,
+    inputs: TextIO,
+    output: TextIO,
+    delimiter: Optional[str] = None,
+) -> Tuple[int, int, int]:
+    """
+    Streams accept or reject for each input line to output as 'accept<TAB>input',
+    returning the number of strings, accepted strings and characters read.
+    """
+    simulator = Simulator(automaton, delimiter)
+    total = accepted = characters = 0
+    for chunk in readInputs(inputs):
+        results = simulator.run(chunk)
+        output.writelines(
+            f"{'accept' if ok else 'reject'}\t{text}\n" for ok, text in zip(results, chunk)
+        )
+        total += len(chunk)
+        accepted += sum(results)
+        characters += sum(len(text) for text in chunk)
+    return total, accepted, characters
+
+
+def runStrings(
+    automaton: Automaton, strings: Iterable[str], delimiter: Optional[str] = None
+) -> List[bool]:
+    """
+    Returns whether each string is accepted, for use from Python.
+    """
+    return Simulator(automaton, delimiter).run(list(strings))
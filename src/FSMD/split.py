@@ -0,0 +1,270 @@
+import os
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from typing import TYPE_CHECKING, Dict, List, Optional, Tuple, Union
+
+from FSMD.cache import RenderCache
+from FSMD.diagram import (
+    EP,
+    addSubscripts,
+    buildGraph,
+    e,
+    iS,
+    loadModel,
+    newGraph,
+    renderDiagram,
+    s,
+)
+from FSMD.dot import DotException, parseFormats, pickEngine
+from FSMD.edges import mergeEdges
+from FSMD.model import FSM
+from FSMD.options import DiagramOptions
+from FSMD.profiling import NULL_PROFILER, Profiler
+from FSMD.worker import DotPool
+
+if TYPE_CHECKING:
+    import graphviz
+
+    from FSMD.svgopt import SVGOptimizer
+
+
+def components(fsm: FSM) -> List[List[int]]:
+    """
+    Returns the strongly connected components of the transition graph. It is
+    Tarjan's algorithm with an explicit stack, linear in the size of the
+    machine. The components reachable from the start come first, in
+    topological order so their transitions stay in a component or go to a
+    later one, followed by any that can not be reached.
+    """
+    n = len(fsm)
+    adjacency = fsm.adjacency
+    dst = fsm.dst
+    index = [-1] * n
+    low = [0] * n
+    onStack = bytearray(n)
+    stack: List[int] = []
+    result: List[List[int]] = []
+    counter = 0
+    reachable = 0
+    roots = [fsm.start] + [state for state in range(n) if state != fsm.start]
+    for root in roots:
+        if index[root] != -1:
+            continue
+        index[root] = low[root] = counter
+        counter += 1
+        stack.append(root)
+        onStack[root] = 1
+        work = [(root, 0)]
+        while work:
+            state, position = work[-1]
+            edges = adjacency[state]
+            if position < len(edges):
+                work[-1] = (state, position + 1)
+                end = dst[edges[position]]
+                if index[end] == -1:
+                    index[end] = low[end] = counter
+                    counter += 1
+                    stack.append(end)
+                    onStack[end] = 1
+                    work.append((end, 0))
+                elif onStack[end] and index[end] < low[state]:
+                    low[state] = index[end]
+                continue
+            work.pop()
+            if work:
+                parent = work[-1][0]
+                if low[state] < low[parent]:
+                    low[parent] = low[state]
+            if low[state] == index[state]:
+                component = []
+                while True:
+                    member = stack.pop()
+                    onStack[member] = 0
+                    component.append(member)
+                    if member == state:
+                        break
+                # Popped in reverse of the order they were found.
+                component.reverse()
+                result.append(component)
+        if root == fsm.start:
+            reachable = len(result)
+    # Each search finds components sinks first.
+    return result[:reachable][::-1] + result[reachable:][::-1]
+
+
+def partition(fsm: FSM, partSize: int) -> List[List[int]]:
+    """
+    Groups the states into parts of at most partSize states. Components are
+    taken in topological order, and small ones are packed into the same part
+    while they fit. A component larger than partSize is cut into pieces in the
+    order its states were found, so each piece is still mostly connected.
+    """
+    parts: List[List[int]] = []
+    current: List[int] = []
+    for component in components(fsm):
+        if len(component) > partSize:
+            if current:
+                parts.append(current)
+                current = []
+            for start in range(0, len(component), partSize):
+                parts.append(component[start : start + partSize])
+            continue
+        if len(current) + len(component) > partSize:
+            parts.append(current)
+            current = []
+        current.extend(component)
+    if current:
+        parts.append(current)
+    return parts
+
+
+def partName(fsm: FSM, part: int) -> str:
+    return f"{fsm.name}-part{part + 1}"
+
+
+def buildSplit(
+    data: Union[dict, FSM],
+    format,
+    options: DiagramOptions,
+    profiler: Profiler = NULL_PROFILER,
+    optimizer: Optional["SVGOptimizer"] = None,
+) -> List["graphviz.Digraph"]:
+    """
+    Builds an overview graph followed by one graph for each part of the
+    machine. Transitions to and from other parts are drawn to a dashed copy of
+    the state in the other part, which links to that part's diagram, and each
+    part in the overview links to its diagram. A machine that fits in one part
+    is built as a single graph instead.
+    """
+    fsm = loadModel(data, options, profiler)
+    format = parseFormats(format)[0]
+    if len(fsm) <= options.partSize:
+        engine = pickEngine(options.engine, len(fsm), fsm.transitionCount)
+        with profiler.span("graph"):
+            return [buildGraph(fsm, format, options.epsilon, options.merge, engine)]
+
+    with profiler.span("split"):
+        parts = partition(fsm, options.partSize)
+        partOf = [0] * len(fsm)
+        for part, states in enumerate(parts):
+            for state in states:
+                partOf[state] = part
+        if options.merge:
+            edges = list(mergeEdges(fsm, options.epsilon))
+        else:
+            edges = list(fsm.transitions())
+        partEdges: List[List[Tuple[int, int, str]]] = [[] for _ in parts]
+        between: Counter = Counter()
+        for start, end, label in edges:
+            partEdges[partOf[start]].append((start, end, label))
+            if partOf[end] != partOf[start]:
+                partEdges[partOf[end]].append((start, end, label))
+                between[partOf[start], partOf[end]] += 1
+
+    def link(part: int) -> str:
+        path = f"{partName(fsm, part)}.{format}"
+        return optimizer.outputPath(path) if optimizer and format == "svg" else path
+
+    with profiler.span("graph"):
+        names = [addSubscripts(state) for state in fsm.states]
+        graphs = [buildOverview(fsm, parts, between, format, options, link)]
+        for part, states in enumerate(parts):
+            G = newGraph(
+                partName(fsm, part),
+                format,
+                pickEngine(options.engine, len(states), len(partEdges[part])),
+            )
+            G.graph_attr["label"] = f"{fsm.name}, part {part + 1} of {len(parts)}"
+            G.graph_attr["labelloc"] = "t"
+            for state in states:
+                if state == fsm.start:
+                    iS(G, names[state], fsm.isFinal(state))
+                else:
+                    s(G, names[state], fsm.isFinal(state))
+            stubs: Dict[int, str] = {}
+            for start, end, label in partEdges[part]:
+                ends = []
+                for state in (start, end):
+                    if partOf[state] == part:
+                        ends.append(names[state])
+                        continue
+                    if state not in stubs:
+                        other = partOf[state]
+                        stubs[state] = f"part{other + 1}/{names[state]}"
+                        G.node(
+                            stubs[state],
+                            f"{names[state]}\n(part {other + 1})",
+                            shape="box",
+                            style="dashed,rounded",
+                            href=link(other),
+                        )
+                    ends.append(stubs[state])
+                e(G, ends[0], ends[1], label.translate(EP) if options.epsilon else label)
+            G.filename = partName(fsm, part)
+            graphs.append(G)
+    return graphs
+
+
+def buildOverview(
+    fsm: FSM,
+    parts: List[List[int]],
+    between: Counter,
+    format,
+    options: DiagramOptions,
+    link,
+) -> "graphviz.Digraph":
+    """
+    Builds the graph of the parts, with an edge labelled with the number of
+    transitions wherever some go from one part to another.
+    """
+    G = newGraph(fsm.name, format, pickEngine(options.engine, len(parts), len(between)))
+    G.graph_attr["label"] = f"{fsm.name}, {len(fsm)} states in {len(parts)} parts"
+    G.graph_attr["labelloc"] = "t"
+    for part, states in enumerate(parts):
+        finals = sum(1 for state in states if fsm.isFinal(state))
+        G.node(
+            f"part{part + 1}",
+            f"Part {part + 1}\n{len(states)} states"
+            + (f", {finals} final" if finals else ""),
+            shape="box",
+            style="rounded",
+            peripheries="2" if finals else "1",
+            href=link(part),
+        )
+        if fsm.start in states:
+            G.node("none", None, shape="point", style="invis")
+            G.edge("none", f"part{part + 1}")
+    for (start, end), count in between.items():
+        G.edge(f"part{start + 1}", f"part{end + 1}", str(count))
+    G.filename = fsm.name
+    return G
+
+
+def renderSplit(
+    graphs: List["graphviz.Digraph"],
+    outputDir: str,
+    format,
+    cache: Optional[RenderCache] = None,
+    timeout: Optional[float] = None,
+    profiler: Profiler = NULL_PROFILER,
+    optimizer: Optional["SVGOptimizer"] = None,
+    jobs: Optional[int] = None,
+) -> int:
+    """
+    Renders the graphs into outputDir at the same time, with up to jobs warm
+    dot processes (one per core by default). Returns how many came from the
+    cache. Each part is profiled as a file of its own.
+    """
+    if outputDir == "-" and len(graphs) > 1:
+        raise DotException("A split diagram must be written to an output directory")
+    jobs = max(1, min(jobs or os.cpu_count() or 1, len(graphs)))
+    with DotPool(jobs) as dot, ThreadPoolExecutor(max_workers=jobs) as pool:
+
+        def render(G) -> bool:
+            with profiler.track(G.filename):
+                return renderDiagram(
+                    G, outputDir, format, cache, dot, timeout, profiler, optimizer
+                )
+
+        futures = [pool.submit(render, G) for G in graphs]
+        return sum(future.result() for future in futures)
@@ -0,0 +1,314 @@
+import functools
+import gzip
+import re
+import sys
+import threading
+import xml.parsers.expat
+from typing import BinaryIO, Dict, List, Optional, Tuple
+
+from FSMD.dot import DotException, openAtomic
+
+CHUNK_SIZE = 64 * 1024
+# Decimal places kept in coordinates, a tenth of a point is below what shows.
+PRECISION = 1
+
+NUMBER = re.compile(r"-?\d*\.\d+")
+# The ids and classes dot gives every graph, node, edge and cluster.
+AUTO_ID = re.compile(r"(a_)?(graph|node|edge|clust)\d+$")
+AUTO_CLASSES = {"graph", "node", "edge", "cluster"}
+GEOMETRY = {
+    "points",
+    "d",
+    "x",
+    "y",
+    "x1",
+    "y1",
+    "x2",
+    "y2",
+    "cx",
+    "cy",
+    "r",
+    "rx",
+    "ry",
+    "width",
+    "height",
+    "viewBox",
+    "transform",
+    "font-size",
+    "stroke-width",
+    "stroke-dasharray",
+}
+# Presentation attributes that are moved into the shared CSS block.
+STYLES = (
+    "fill",
+    "fill-opacity",
+    "stroke",
+    "stroke-width",
+    "stroke-dasharray",
+    "stroke-opacity",
+    "font-family",
+    "font-size",
+    "font-weight",
+    "font-style",
+    "text-anchor",
+)
+# Unitless lengths are user units in attributes, but need px in CSS.
+LENGTHS = {"font-size", "stroke-width"}
+UNSAFE_CSS = re.compile(r"[;{}<>\\]")
+UNITLESS = re.compile(r"-?[\d.]+$")
+SPECIAL = re.compile(r'[&<>"\n\t\r]')
+
+
+class SVGOptimizer:
+    """
+    Rewrites the SVG from dot into a smaller one, reading and writing it in
+    chunks, so an SVG streamed from a file is never held in memory whole.
+    Comments, the doctype and the title of every node and edge are dropped,
+    as are the ids and classes dot gives them, coordinates are rounded, and
+    presentation attributes become classes in one CSS block. The output can
+    also be gzipped.
+
+    It is safe to share between threads, and keeps the total size of every
+    file before and after for reporting.
+    """
+
+    def __init__(self, compress: bool = False, precision: int = PRECISION) -> None:
+        self.compress = compress
+        self.precision = precision
+        self.lock = threading.Lock()
+        self.files = 0
+        self.sizeIn = 0
+        self.sizeOut = 0
+
+    def outputPath(self, path: str) -> str:
+        return path + ".gz" if self.compress and path != "-" else path
+
+    def optimize(self, src: BinaryIO, dst: BinaryIO) -> Tuple[int, int]:
+        """
+        Optimizes the SVG read from src into dst, returning the number of bytes
+        read and written.
+        """
+        counter = CountingWriter(dst)
+        out = gzip.GzipFile(fileobj=counter, mode="wb", mtime=0) if self.compress else counter
+        rewriter = SVGRewriter(out, self.precision)
+        sizeIn = 0
+        for chunk in iter(lambda: src.read(CHUNK_SIZE), b""):
+            sizeIn += len(chunk)
+            rewriter.feed(chunk)
+        rewriter.close()
+        if self.compress:
+            # Only writes the gzip trailer, the file object is left open.
+            out.close()
+        with self.lock:
+            self.files += 1
+            self.sizeIn += sizeIn
+            self.sizeOut += counter.size
+        return sizeIn, counter.size
+
+    def optimizeTo(self, src: BinaryIO, path: str) -> None:
+        """
+        Writes the optimized SVG from src to path, with .gz added when
+        compressing, or to stdout if path is '-'.
+        """
+        if path == "-":
+            self.optimize(src, sys.stdout.buffer)
+            sys.stdout.buffer.flush()
+        else:
+            with openAtomic(self.outputPath(path)) as f:
+                self.optimize(src, f)
+
+    def report(self) -> str:
+        saved = 1 - self.sizeOut / self.sizeIn if self.sizeIn else 0
+        return (
+            f"Optimized SVG from {self.sizeIn / 1024:.1f} KiB to "
+            f"{self.sizeOut / 1024:.1f} KiB ({saved:.0%} smaller)"
+        )
+
+
+class CountingWriter:
+    "Passes writes through to a file, counting the bytes"
+
+    def __init__(self, f: BinaryIO) -> None:
+        self.f = f
+        self.size = 0
+
+    def write(self, data: bytes) -> int:
+        self.size += len(data)
+        return self.f.write(data)
+
+    def flush(self) -> None:
+        self.f.flush()
+
+
+class SVGRewriter:
+    """
+    The expat handlers behind SVGOptimizer. Output is buffered and written in
+    chunks, and the start tag of an element is only closed once it is known
+    whether the element is empty, so empty ones can be written as <tag/>.
+    """
+
+    def __init__(self, out, precision: int) -> None:
+        self.out = out
+        self.precision = precision
+        self.parts: List[str] = []
+        self.size = 0
+        self.text: List[str] = []
+        self.depth = 0
+        self.inText = 0
+        self.skip = 0
+        self.titles = 0
+        self.startOpen = False
+        self.classes: Dict[Tuple[Tuple[str, str], ...], str] = {}
+        self.parser = xml.parsers.expat.ParserCreate()
+        self.parser.ordered_attributes = True
+        self.parser.StartElementHandler = self.start
+        self.parser.EndElementHandler = self.end
+        self.parser.CharacterDataHandler = self.characters
+
+    def feed(self, data: bytes) -> None:
+        try:
+            self.parser.Parse(data, False)
+        except xml.parsers.expat.ExpatError as err:
+            raise DotException(f"The SVG from dot could not be optimized: {err}")
+
+    def close(self) -> None:
+        try:
+            self.parser.Parse(b"", True)
+        except xml.parsers.expat.ExpatError as err:
+            raise DotException(f"The SVG from dot could not be optimized: {err}")
+        self.flush()
+
+    def write(self, text: str) -> None:
+        self.parts.append(text)
+        self.size += len(text)
+        if self.size >= CHUNK_SIZE:
+            self.flush()
+
+    def flush(self) -> None:
+        if self.parts:
+            self.out.write("".join(self.parts).encode("utf-8"))
+            self.parts = []
+            self.size = 0
+
+    def closeStart(self) -> None:
+        if self.startOpen:
+            self.write(">")
+            self.startOpen = False
+
+    def flushText(self) -> None:
+        if not self.text:
+            return
+        text = "".join(self.text)
+        self.text = []
+        # Whitespace between elements is only formatting, except inside <text>.
+        if self.inText or text.strip():
+            self.closeStart()
+            self.write(escape(text))
+
+    def characters(self, data: str) -> None:
+        if not self.skip:
+            self.text.append(data)
+
+    def start(self, name: str, attributes: List[str]) -> None:
+        if self.skip:
+            self.skip += 1
+            return
+        self.flushText()
+        if name == "title":
+            self.titles += 1
+            # The first is the graph's own title, the rest name nodes and edges.
+            if self.titles > 1:
+                self.skip = 1
+                return
+        self.closeStart()
+        self.depth += 1
+        if name == "text":
+            self.inText += 1
+
+        kept = []
+        styles = []
+        classes = []
+        for key, value in zip(attributes[::2], attributes[1::2]):
+            if key in GEOMETRY and "." in value:
+                value = NUMBER.sub(self.roundNumber, value)
+            if key == "id" and AUTO_ID.match(value):
+                continue
+            if key == "class":
+                classes += [c for c in value.split() if c not in AUTO_CLASSES]
+            elif key in STYLES and not UNSAFE_CSS.search(value):
+                if key in LENGTHS and UNITLESS.match(value):
+                    value += "px"
+                styles.append((key, value))
+            else:
+                kept.append((key, value))
+        if styles:
+            style = tuple(styles)
+            if style not in self.classes:
+                self.classes[style] = f"s{len(self.classes)}"
+            classes.append(self.classes[style])
+        if classes:
+            kept.append(("class", " ".join(classes)))
+        self.write(f"<{name}" + "".join(f' {key}="{quote(value)}"' for key, value in kept))
+        self.startOpen = True
+
+    def end(self, name: str) -> None:
+        if self.skip:
+            self.skip -= 1
+            return
+        self.flushText()
+        if self.depth == 1 and self.classes:
+            self.closeStart()
+            self.write("<style>" + self.css() + "</style>")
+        self.depth -= 1
+        if name == "text":
+            self.inText -= 1
+        if self.startOpen:
+            self.write("/>")
+            self.startOpen = False
+        else:
+            self.write(f"</{name}>")
+
+    def css(self) -> str:
+        return "".join(
+            f".{name}{{" + ";".join(f"{key}:{value}" for key, value in style) + "}"
+            for style, name in self.classes.items()
+        )
+
+    def roundNumber(self, match) -> str:
+        return roundNumber(match.group(), self.precision)
+
+
+@functools.lru_cache(maxsize=65536)
+def roundNumber(number: str, precision: int) -> str:
+    text = f"{float(number):.{precision}f}"
+    if "." in text:
+        text = text.rstrip("0").rstrip(".")
+    return "0" if text in ("-0", "") else text
+
+
+def escape(text: str) -> str:
+    if not SPECIAL.search(text):
+        return text
+    return text.replace("&", "&amp;").replace("<", "&lt;").replace(">", "&gt;")
+
+
+def quote(value: str) -> str:
+    if not SPECIAL.search(value):
+        return value
+    return (
+        escape(value)
+        .replace('"', "&quot;")
+        .replace("\n", "&#10;")
+        .replace("\t", "&#9;")
+        .replace("\r", "&#13;")
+    )
+
+
+def optimizerFor(optimize: bool, compress: bool) -> Optional[SVGOptimizer]:
+    """
+    Returns the optimizer for the --optimize and --gzip options, compressing
+    implies optimizing.
+    """
+    if optimize or compress:
+        return SVGOptimizer(compress)
+    return None
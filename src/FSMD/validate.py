@@ -0,0 +1,225 @@
+from typing import Any, List, NamedTuple, Optional, Tuple
+
+import yaml
+
+from FSMD.loader import SafeLoader, detectFormat
+
+REQUIRED_KEYS = ("filename", "states", "startstate", "finalstates", "transitions")
+STATE_LISTS = ("states", "finalstates")
+
+
+class ValidationError(NamedTuple):
+    path: Tuple
+    message: str
+    line: Optional[int] = None
+
+    def __str__(self) -> str:
+        where = self.path[0] + "".join(f"[{p}]" for p in self.path[1:])
+        if self.line is not None:
+            where = f"line {self.line}: {where}"
+        return f"{where}: {self.message}"
+
+
+class ValidationException(Exception):
+    "An exception raised when an FSM file is not valid, holding every error found"
+
+    errors: List[ValidationError]
+
+    def __init__(self, errors: List[ValidationError]) -> None:
+        self.errors = errors
+        super().__init__(self.message)
+
+    @property
+    def message(self) -> str:
+        return "\n".join(str(error) for error in self.errors)
+
+    def locate(self, fsmFile: str, inputFormat: Optional[str] = None) -> None:
+        """
+        Adds line numbers to the errors by reading fsmFile again. This is only
+        done once a file is known to be invalid, so valid files are parsed once.
+        """
+        inputFormat = inputFormat or detectFormat(fsmFile)
+        if fsmFile == "-" or inputFormat == "json":
+            return
+        try:
+            with open(fsmFile, "r", encoding="utf-8") as f:
+                if inputFormat == "text":
+                    lines = textLines(f)
+                else:
+                    lines = yamlLines(yaml.compose(f, Loader=SafeLoader))
+        except (OSError, yaml.YAMLError):
+            return
+        self.errors = [
+            error._replace(line=lines.get(error.path, lines.get(error.path[:1])))
+            for error in self.errors
+        ]
+
+
+def yamlLines(node, path: Tuple = (), lines: Optional[dict] = None) -> dict:
+    """
+    Maps the path of every value in a YAML node tree to its line number.
+    """
+    if lines is None:
+        lines = {}
+    if node is None:
+        return lines
+    lines[path] = node.start_mark.line + 1
+    if isinstance(node, yaml.MappingNode):
+        for key, value in node.value:
+            yamlLines(value, path + (key.value,), lines)
+            lines[path + (key.value,)] = key.start_mark.line + 1
+    elif isinstance(node, yaml.SequenceNode):
+        for i, item in enumerate(node.value):
+            lines[path + (i,)] = item.start_mark.line + 1
+    return lines
+
+
+def textLines(stream) -> dict:
+    """
+    Maps paths to line numbers for the compact text format.
+    """
+    lines = {}
+    inHeader = True
+    count = 0
+    for lineNo, line in enumerate(stream, 1):
+        line = line.strip()
+        if not line or line.startswith("#"):
+            continue
+        if inHeader:
+            if line == "---":
+                inHeader = False
+                lines[("transitions",)] = lineNo
+                continue
+            key = line.partition(":")[0].strip()
+            lines[(key,)] = lineNo
+            if key in STATE_LISTS:
+                values = [v for v in line.partition(":")[2].split(";") if v.strip()]
+                for i in range(len(values)):
+                    lines[(key, i)] = lineNo
+        else:
+            lines[("transitions", count)] = lineNo
+            count += 1
+    return lines
+
+
+def stateName(value: Any) -> Optional[str]:
+    """
+    Returns a state name as a string, or None if it is not a valid name.
+    Numbers are allowed, since YAML reads a state like 1 as an integer. A name
+    can not end in a backslash, which would escape the closing quote in dot.
+    """
+    if isinstance(value, bool) or not isinstance(value, (str, int, float)):
+        return None
+    name = str(value)
+    if not name or ";" in name or name.endswith("\\"):
+        return None
+    return name
+
+
+def findErrors(data: Any) -> Tuple[List[ValidationError], dict]:
+    """
+    Checks an FSM in one pass over its data, covering the structure, that
+    every referenced state is listed, and duplicates. Returns every error
+    found, along with the data where state names have been made strings.
+    """
+    errors: List[ValidationError] = []
+    add = errors.append
+    if not isinstance(data, dict):
+        return [ValidationError(("file",), "must be a mapping of the FSM sections")], {}
+
+    for key in REQUIRED_KEYS:
+        if key not in data:
+            add(ValidationError((key,), "is missing"))
+    for key in data:
+        if key not in REQUIRED_KEYS:
+            add(ValidationError((str(key),), "is not a known section"))
+
+    result = {"filename": str(data.get("filename", ""))}
+
+    states = []
+    stateSet = set()
+    value = data.get("states", [])
+    if not isinstance(value, list):
+        add(ValidationError(("states",), "must be a list of states"))
+        value = []
+    for i, state in enumerate(value):
+        name = stateName(state)
+        if name is None:
+            add(ValidationError(("states", i), f"{state!r} is not a valid state name"))
+        elif name in stateSet:
+            add(ValidationError(("states", i), f"{name} is listed more than once"))
+        else:
+            stateSet.add(name)
+            states.append(name)
+    result["states"] = states
+
+    start = data.get("startstate")
+    if "startstate" in data:
+        name = stateName(start)
+        if name is None:
+            add(ValidationError(("startstate",), f"{start!r} is not a valid state name"))
+        elif name not in stateSet and "states" in data:
+            add(ValidationError(("startstate",), f"{name} is not listed in states"))
+        start = name
+    result["startstate"] = start
+
+    final = []
+    finalSet = set()
+    value = data.get("finalstates", [])
+    if value is None:
+        value = []
+    if not isinstance(value, list):
+        add(ValidationError(("finalstates",), "must be a list of states"))
+        value = []
+    for i, state in enumerate(value):
+        name = stateName(state)
+        if name is None:
+            add(ValidationError(("finalstates", i), f"{state!r} is not a valid state name"))
+        elif name in finalSet:
+            add(ValidationError(("finalstates", i), f"{name} is listed more than once"))
+        elif name not in stateSet:
+            add(ValidationError(("finalstates", i), f"{name} is not listed in states"))
+        else:
+            finalSet.add(name)
+            final.append(name)
+    result["finalstates"] = final
+
+    transitions = data.get("transitions", [])
+    if transitions is None:
+        transitions = []
+    if not isinstance(transitions, list):
+        add(ValidationError(("transitions",), "must be a list of transitions"))
+        transitions = []
+    seen = set()
+    for i, edge in enumerate(transitions):
+        parts = edge.split(";") if isinstance(edge, str) else ()
+        if len(parts) != 3 or not (parts[0] and parts[1] and parts[2]):
+            add(ValidationError(("transitions", i), f"{edge!r} is not FROM;TO;LABEL"))
+            continue
+        if parts[2].endswith("\\"):
+            add(ValidationError(("transitions", i), f"{edge} has a label ending in a backslash"))
+            continue
+        if parts[0] not in stateSet or parts[1] not in stateSet:
+            missing = parts[0] if parts[0] not in stateSet else parts[1]
+            add(
+                ValidationError(
+                    ("transitions", i), f"{edge} uses {missing}, which is not listed in states"
+                )
+            )
+        elif edge in seen:
+            add(ValidationError(("transitions", i), f"{edge} is listed more than once"))
+        else:
+            seen.add(edge)
+    result["transitions"] = transitions
+    return errors, result
+
+
+def validateFSM(data: Any) -> dict:
+    """
+    Validates the data of an FSM file, raising a ValidationException with every
+    error if it is invalid.
+    """
+    errors, result = findErrors(data)
+    if errors:
+        raise ValidationException(errors)
+    return result
@@ -0,0 +1,276 @@
+import ctypes
+import ctypes.util
+import hashlib
+import json
+import os
+import platform
+import select
+import struct
+import time
+from typing import Dict, List, Optional, Set
+
+from rich import print as Print
+
+from FSMD.batch import FSM_EXTENSIONS
+from FSMD.compiled import isCompiled, loadCompiled
+from FSMD.diagram import buildDiagram, layoutEngine, renderDiagram
+from FSMD.dot import DotException, parseFormats
+from FSMD.loader import LoaderException, parseFile
+from FSMD.model import FSMException
+from FSMD.options import DiagramOptions
+from FSMD.svgopt import optimizerFor
+from FSMD.validate import ValidationException, validateFSM
+from FSMD.worker import DotPool
+
+IN_MODIFY = 0x002
+IN_CLOSE_WRITE = 0x008
+IN_MOVED_TO = 0x080
+IN_CREATE = 0x100
+IN_DELETE = 0x200
+IN_NONBLOCK = 0o4000
+EVENT_HEADER = struct.Struct("iIII")
+
+
+def isFSMFile(path: str) -> bool:
+    return path.lower().endswith(FSM_EXTENSIONS)
+
+
+class PollingWatcher:
+    """
+    Finds changed files by comparing modification times, works everywhere.
+    """
+
+    interval: float = 0.25
+
+    def __init__(self, dirs: Set[str]) -> None:
+        self.dirs = dirs
+        self.seen = self.scan()
+
+    def scan(self) -> Dict[str, tuple]:
+        found = {}
+        for directory in self.dirs:
+            try:
+                names = os.listdir(directory)
+            except OSError:
+                continue
+            for name in names:
+                path = os.path.join(directory, name)
+                try:
+                    st = os.stat(path)
+                except OSError:
+                    continue
+                found[path] = (st.st_mtime_ns, st.st_size)
+        return found
+
+    def wait(self, timeout: Optional[float]) -> Set[str]:
+        """
+        Returns the paths that changed, or an empty set after timeout seconds.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            current = self.scan()
+            changed = {
+                path
+                for path in set(current) | set(self.seen)
+                if current.get(path) != self.seen.get(path)
+            }
+            self.seen = current
+            if changed:
+                return changed
+            if deadline is not None and time.monotonic() >= deadline:
+                return set()
+            time.sleep(
+                self.interval
+                if deadline is None
+                else min(self.interval, max(0, deadline - time.monotonic()))
+            )
+
+    def close(self) -> None:
+        pass
+
+
+class InotifyWatcher:
+    """
+    Uses Linux inotify to hear about changes as soon as a file is written.
+    Directories are watched rather than files, since editors often save by
+    replacing the file.
+    """
+
+    def __init__(self, dirs: Set[str]) -> None:
+        self.libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        self.fd = self.libc.inotify_init1(IN_NONBLOCK)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self.wds: Dict[int, str] = {}
+        mask = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE | IN_DELETE
+        for directory in dirs:
+            wd = self.libc.inotify_add_watch(self.fd, os.fsencode(directory), mask)
+            if wd < 0:
+                self.close()
+                raise OSError(ctypes.get_errno(), f"Could not watch {directory}")
+            self.wds[wd] = directory
+
+    def wait(self, timeout: Optional[float]) -> Set[str]:
+        """
+        Returns the paths that changed, or an empty set after timeout seconds.
+        """
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if not ready:
+            return set()
+        changed = set()
+        try:
+            buf = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return changed
+        offset = 0
+        while offset < len(buf):
+            wd, _, _, length = EVENT_HEADER.unpack_from(buf, offset)
+            offset += EVENT_HEADER.size
+            name = buf[offset : offset + length].rstrip(b"\0")
+            offset += length
+            if wd in self.wds and name:
+                changed.add(os.path.join(self.wds[wd], os.fsdecode(name)))
+        return changed
+
+    def close(self) -> None:
+        if self.fd >= 0:
+            os.close(self.fd)
+            self.fd = -1
+
+
+def getWatcher(dirs: Set[str], poll: bool = False):
+    if not poll and platform.system() == "Linux":
+        try:
+            return InotifyWatcher(dirs)
+        except (OSError, AttributeError, TypeError):
+            pass
+    return PollingWatcher(dirs)
+
+
+class DiagramWatcher:
+    """
+    Keeps the state needed to re-render only the files whose parsed content
+    has changed since they were last rendered.
+    """
+
+    def __init__(
+        self,
+        outputDir: str,
+        format: str,
+        options: DiagramOptions,
+        pool: DotPool,
+        inputFormat: Optional[str] = None,
+    ) -> None:
+        self.outputDir = outputDir
+        self.format = format
+        self.options = options
+        self.pool = pool
+        self.inputFormat = inputFormat
+        self.optimizer = optimizerFor(options.optimize, options.gzip)
+        self.hashes: Dict[str, str] = {}
+
+    def update(self, fsmFile: str) -> None:
+        startTime = time.perf_counter()
+        compiled = isCompiled(fsmFile, self.inputFormat)
+        try:
+            if compiled:
+                with open(fsmFile, "rb") as f:
+                    digest = hashlib.sha256(f.read()).hexdigest()
+            else:
+                data = parseFile(fsmFile, self.inputFormat)
+                digest = hashlib.sha256(
+                    json.dumps(data, sort_keys=True, default=str).encode("utf-8")
+                ).hexdigest()
+        except FileNotFoundError:
+            self.hashes.pop(fsmFile, None)
+            return
+        except LoaderException as err:
+            Print(f"[red bold]ERROR[/] {err.message}")
+            return
+        except OSError as err:
+            Print(f"[red bold]ERROR[/] {fsmFile}: {err}")
+            return
+        if self.hashes.get(fsmFile) == digest:
+            return
+        try:
+            machine = loadCompiled(fsmFile) if compiled else validateFSM(data)
+            G = buildDiagram(machine, self.format, self.options)
+            renderDiagram(
+                G,
+                self.outputDir,
+                self.format,
+                pool=self.pool,
+                timeout=self.options.timeout,
+                optimizer=self.optimizer,
+            )
+        except ValidationException as vE:
+            vE.locate(fsmFile, self.inputFormat)
+            Print(f"[red bold]ERROR[/] {fsmFile}: FSM File is Invalid.\n\n{vE.message}")
+            return
+        except (FSMException, DotException) as err:
+            Print(f"[red bold]ERROR[/] {fsmFile}: {err.message}")
+            return
+        # Only once it rendered, so saving the same content again retries a failure.
+        self.hashes[fsmFile] = digest
+        elapsed = (time.perf_counter() - startTime) * 1000
+        outputs = []
+        for format in parseFormats(self.format):
+            output = f"{self.outputDir}/{G.filename}.{format}"
+            if self.optimizer is not None and format == "svg":
+                output = self.optimizer.outputPath(output)
+            outputs.append(output)
+        Print(
+            f"[bold blue]{time.strftime('%H:%M:%S')} Rendered {fsmFile} "
+            f"to {', '.join(outputs)}[/] "
+            f"[dim]({elapsed:.0f}ms, {layoutEngine(G)})[/]"
+        )
+
+
+def watchFiles(
+    inputs: List[str],
+    outputDir: str,
+    format: str,
+    options: Optional[DiagramOptions] = None,
+    debounce: float = 0.2,
+    poll: bool = False,
+    inputFormat: Optional[str] = None,
+) -> None:
+    """
+    Renders every input, then re-renders files as they change until interrupted.
+    Inputs may be FSM files, or directories where every FSM file is watched.
+    """
+    files = {os.path.abspath(i) for i in inputs if not os.path.isdir(i)}
+    dirs = {os.path.abspath(i) for i in inputs if os.path.isdir(i)}
+    watcher = getWatcher(dirs | {os.path.dirname(f) for f in files}, poll)
+
+    def watched(path: str) -> bool:
+        return path in files or (os.path.dirname(path) in dirs and isFSMFile(path))
+
+    with DotPool(1) as pool:
+        diagrams = DiagramWatcher(
+            outputDir, format, options or DiagramOptions(), pool, inputFormat
+        )
+        for directory in sorted(dirs):
+            files.update(
+                os.path.join(directory, name)
+                for name in os.listdir(directory)
+                if isFSMFile(name)
+            )
+        for fsmFile in sorted(files):
+            diagrams.update(fsmFile)
+        Print(f"[bold magenta]Watching {len(files)} files for changes...[/]")
+        try:
+            while True:
+                changed = watcher.wait(None)
+                # Wait for a quiet period so a burst of saves renders once.
+                while True:
+                    more = watcher.wait(debounce)
+                    if not more:
+                        break
+                    changed |= more
+                for path in sorted(filter(watched, changed)):
+                    diagrams.update(path)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            watcher.close()
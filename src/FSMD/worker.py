@@ -0,0 +1,231 @@
+import collections
+import queue
+import struct
+import subprocess
+import threading
+from typing import BinaryIO, Dict, List, Optional
+
+from FSMD.dot import DotException, DotTimeout, dotPath, pipeDot
+
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+
+
+def readSvg(stream: BinaryIO) -> bytes:
+    lines = []
+    while True:
+        line = stream.readline()
+        if not line:
+            raise EOFError
+        lines.append(line)
+        if line.rstrip().endswith(b"</svg>"):
+            return b"".join(lines)
+
+
+def readPdf(stream: BinaryIO) -> bytes:
+    lines = []
+    while True:
+        line = stream.readline()
+        if not line:
+            raise EOFError
+        lines.append(line)
+        if line.rstrip() == b"%%EOF":
+            return b"".join(lines)
+
+
+def readExactly(stream: BinaryIO, size: int) -> bytes:
+    data = stream.read(size)
+    if len(data) != size:
+        raise EOFError
+    return data
+
+
+def readPng(stream: BinaryIO) -> bytes:
+    parts = [readExactly(stream, len(PNG_SIGNATURE))]
+    if parts[0] != PNG_SIGNATURE:
+        raise DotException("dot did not output a PNG image")
+    while True:
+        header = readExactly(stream, 8)
+        parts.append(header)
+        (length,) = struct.unpack(">I", header[:4])
+        parts.append(readExactly(stream, length + 4))
+        if header[4:] == b"IEND":
+            return b"".join(parts)
+
+
+# Formats where the end of one image can be found in dot's output stream.
+FRAMED = {"svg": readSvg, "png": readPng, "pdf": readPdf}
+# How long a worker may spend on a layout before it is thought to be stuck.
+LAYOUT_TIMEOUT = 600.0
+
+
+class DotStalled(Exception):
+    "Raised when a dot worker stops producing output for a graph"
+
+
+class DotWorker:
+    """
+    A long-lived dot process for one output format. Graphs are written to its
+    stdin one after another, and each image is read back from its stdout.
+    """
+
+    format: str
+    timeout: float
+    layoutTimeout: float
+    proc: subprocess.Popen or None = None
+
+    def __init__(
+        self, format: str, timeout: float = 30.0, layoutTimeout: float = LAYOUT_TIMEOUT
+    ) -> None:
+        if format not in FRAMED:
+            raise DotException(f"{format} can not be rendered by a dot worker")
+        self.format = format
+        self.timeout = timeout
+        self.layoutTimeout = layoutTimeout
+        self.stderr = collections.deque(maxlen=20)
+
+    def start(self) -> None:
+        self.stderr.clear()
+        self.proc = subprocess.Popen(
+            [dotPath(), f"-T{self.format}"],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+        )
+        # Drain stderr so warnings can never fill the pipe and block dot.
+        threading.Thread(
+            target=self.drain, args=(self.proc.stderr,), daemon=True
+        ).start()
+
+    def drain(self, stream: BinaryIO) -> None:
+        for line in iter(stream.readline, b""):
+            self.stderr.append(line.decode(errors="replace").strip())
+
+    def alive(self) -> bool:
+        return self.proc is not None and self.proc.poll() is None
+
+    def render(self, source: str, layoutTimeout: Optional[float] = None) -> bytes:
+        """
+        Renders one graph, starting dot first if it is not running. Raises a
+        DotException if dot crashed, or DotStalled if it stopped responding.
+        A large graph can take minutes before dot writes anything, so the
+        layout gets layoutTimeout seconds, the worker's own unless one is given,
+        and only then does reading the image have to finish within timeout.
+        """
+        if not self.alive():
+            self.start()
+        # Kept, since a stall clears self.proc from the timer's thread.
+        proc = self.proc
+        timedOut = threading.Event()
+
+        def stall():
+            timedOut.set()
+            self.close()
+
+        timer = threading.Timer(layoutTimeout or self.layoutTimeout, stall)
+        timer.start()
+        try:
+            proc.stdin.write(source.encode("utf-8") + b"\n")
+            proc.stdin.flush()
+            # Blocks until dot has finished the layout and starts writing.
+            proc.stdout.peek(1)
+            timer.cancel()
+            timer = threading.Timer(self.timeout, stall)
+            timer.start()
+            return FRAMED[self.format](proc.stdout)
+        except (EOFError, OSError, ValueError):
+            self.close()
+            if timedOut.is_set():
+                raise DotStalled
+            raise DotException(
+                "dot worker exited: " + " ".join(self.stderr).strip()
+            )
+        finally:
+            timer.cancel()
+
+    def close(self) -> None:
+        proc, self.proc = self.proc, None
+        if proc is None:
+            return
+        try:
+            proc.stdin.close()
+        except OSError:
+            pass
+        try:
+            proc.wait(timeout=1)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+            proc.wait()
+
+
+class DotPool:
+    """
+    Keeps up to size warm dot workers per output format, so batch and embedded
+    callers pay the process start once instead of once per diagram. A worker
+    that crashes is replaced on the next render. If a worker stops answering,
+    that diagram is rendered by its own dot process instead, and the worker is
+    restarted for the next one.
+    """
+
+    size: int
+    timeout: float
+    layoutTimeout: float
+
+    def __init__(
+        self, size: int = 1, timeout: float = 30.0, layoutTimeout: float = LAYOUT_TIMEOUT
+    ) -> None:
+        self.size = max(1, size)
+        self.timeout = timeout
+        self.layoutTimeout = layoutTimeout
+        self.lock = threading.Lock()
+        self.idle: Dict[str, queue.Queue] = {}
+        self.workers: List[DotWorker] = []
+
+    def acquire(self, format: str) -> DotWorker:
+        with self.lock:
+            if format not in self.idle:
+                self.idle[format] = queue.Queue()
+                for _ in range(self.size):
+                    self.idle[format].put(DotWorker(format, self.timeout, self.layoutTimeout))
+            idle = self.idle[format]
+        worker = idle.get()
+        with self.lock:
+            if worker not in self.workers:
+                self.workers.append(worker)
+        return worker
+
+    def release(self, worker: DotWorker) -> None:
+        self.idle[worker.format].put(worker)
+
+    def render(self, source: str, format: str, timeout: Optional[float] = None) -> bytes:
+        """
+        Renders one graph on a warm worker. With a timeout, a layout that takes
+        longer raises a DotTimeout, otherwise a worker that stops answering is
+        replaced by a dot process of its own for this graph.
+        """
+        if format not in FRAMED:
+            return pipeDot(source, format, timeout)
+        worker = self.acquire(format)
+        try:
+            try:
+                return worker.render(source, timeout)
+            except DotException:
+                # The worker crashed, retry once on a fresh process.
+                return worker.render(source, timeout)
+        except DotStalled:
+            if timeout is not None:
+                raise DotTimeout(f"The layout took longer than {timeout:g}s")
+            return pipeDot(source, format)
+        finally:
+            self.release(worker)
+
+    def close(self) -> None:
+        with self.lock:
+            workers, self.workers = self.workers, []
+        for worker in workers:
+            worker.close()
+
+    def __enter__(self) -> "DotPool":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
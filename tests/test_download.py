@@ -0,0 +1,173 @@
+"""
+Tests the Graphviz download against a local HTTP server standing in for the
+release host, so that resuming and checksum verification run offline. Run it
+with FSMD installed, or from the repository root with PYTHONPATH=src:
+
+    python -m pytest tests
+"""
+import hashlib
+import io
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+import zipfile
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from FSMD.download import CHUNK_SIZE, DownloadException, download, fetchChecksum
+
+
+def makeArchive() -> bytes:
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as zf:
+        zf.writestr("Graphviz/bin/dot.exe", os.urandom(256 * 1024))
+        zf.writestr("Graphviz/share/readme.txt", "Graphviz\n" * 1000)
+    return buffer.getvalue()
+
+
+class ReleaseHandler(BaseHTTPRequestHandler):
+    "Serves the archive and its checksum, honouring Range requests"
+
+    def do_GET(self) -> None:
+        host = self.server.host
+        host.requests.append((self.path, self.headers.get("Range")))
+        if self.path == "/graphviz.zip.sha256":
+            body = f"{host.checksum}  graphviz.zip\n".encode()
+            self.reply(200, body, {})
+            return
+        if self.path != "/graphviz.zip":
+            self.reply(404, b"", {})
+            return
+        data = host.archive
+        start = 0
+        requested = self.headers.get("Range")
+        if requested:
+            start = int(requested.split("=")[1].split("-")[0])
+            if start >= len(data):
+                self.reply(416, b"", {})
+                return
+        headers = {}
+        if start:
+            headers["Content-Range"] = f"bytes {start}-{len(data) - 1}/{len(data)}"
+        body = data[start:]
+        if host.dropAfter is not None:
+            # Sends the full length, then closes the connection partway.
+            self.send_response(206 if start else 200)
+            for key, value in headers.items():
+                self.send_header(key, value)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body[: host.dropAfter])
+            host.dropAfter = None
+            self.close_connection = True
+            return
+        self.reply(206 if start else 200, body, headers)
+
+    def reply(self, status: int, body: bytes, headers: dict) -> None:
+        self.send_response(status)
+        for key, value in headers.items():
+            self.send_header(key, value)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format: str, *args) -> None:
+        pass
+
+
+class DownloadTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls) -> None:
+        cls.archive = makeArchive()
+        cls.checksum = hashlib.sha256(cls.archive).hexdigest()
+        cls.server = ThreadingHTTPServer(("127.0.0.1", 0), ReleaseHandler)
+        cls.server.host = cls
+        cls.url = f"http://127.0.0.1:{cls.server.server_address[1]}/graphviz.zip"
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+
+    @classmethod
+    def tearDownClass(cls) -> None:
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def setUp(self) -> None:
+        type(self).requests = []
+        type(self).dropAfter = None
+        self.directory = tempfile.mkdtemp(prefix="fsmd-test-")
+        self.cacheDir = os.path.join(self.directory, "cache")
+        self.extractTo = os.path.join(self.directory, "graphviz")
+        os.mkdir(self.extractTo)
+
+    def tearDown(self) -> None:
+        shutil.rmtree(self.directory)
+
+    def assertExtracted(self) -> None:
+        with zipfile.ZipFile(io.BytesIO(self.archive)) as zf:
+            expected = zf.read("Graphviz/bin/dot.exe")
+        with open(os.path.join(self.extractTo, "Graphviz", "bin", "dot.exe"), "rb") as f:
+            self.assertEqual(f.read(), expected)
+
+    def testVerifiesAgainstPublishedChecksum(self) -> None:
+        archive = download(
+            self.url,
+            self.cacheDir,
+            extractTo=self.extractTo,
+            checksumUrl=self.url + ".sha256",
+        )
+        with open(archive, "rb") as f:
+            self.assertEqual(f.read(), self.archive)
+        self.assertExtracted()
+        self.assertEqual(self.requests[0], ("/graphviz.zip.sha256", None))
+
+    def testRejectsWrongChecksum(self) -> None:
+        with self.assertRaises(DownloadException):
+            download(self.url, self.cacheDir, sha256="0" * 64, extractTo=self.extractTo)
+        self.assertEqual(os.listdir(self.cacheDir), [])
+        self.assertEqual(os.listdir(self.extractTo), [])
+
+    def testResumesPartialDownload(self) -> None:
+        os.makedirs(self.cacheDir)
+        half = len(self.archive) // 2
+        with open(os.path.join(self.cacheDir, "graphviz.zip.part"), "wb") as f:
+            f.write(self.archive[:half])
+        download(self.url, self.cacheDir, sha256=self.checksum, extractTo=self.extractTo)
+        self.assertEqual(self.requests, [("/graphviz.zip", f"bytes={half}-")])
+        self.assertExtracted()
+
+    def testResumesAfterConnectionDrops(self) -> None:
+        # Whole chunks, since a chunk cut short by the drop is not kept.
+        type(self).dropAfter = 2 * CHUNK_SIZE
+        download(self.url, self.cacheDir, sha256=self.checksum, extractTo=self.extractTo)
+        self.assertEqual(
+            self.requests,
+            [("/graphviz.zip", None), ("/graphviz.zip", f"bytes={2 * CHUNK_SIZE}-")],
+        )
+        self.assertExtracted()
+
+    def testUsesVerifiedCacheWithoutNetwork(self) -> None:
+        download(self.url, self.cacheDir, sha256=self.checksum)
+        type(self).requests = []
+        download(
+            self.url,
+            self.cacheDir,
+            extractTo=self.extractTo,
+            checksumUrl=self.url + ".sha256",
+        )
+        self.assertEqual(self.requests, [])
+        self.assertExtracted()
+
+    def testRedownloadsDamagedCache(self) -> None:
+        download(self.url, self.cacheDir, sha256=self.checksum)
+        with open(os.path.join(self.cacheDir, "graphviz.zip"), "r+b") as f:
+            f.write(b"damaged")
+        download(self.url, self.cacheDir, sha256=self.checksum, extractTo=self.extractTo)
+        self.assertExtracted()
+
+    def testChecksumMustBeSha256(self) -> None:
+        with self.assertRaises(DownloadException):
+            fetchChecksum(self.url.replace("graphviz.zip", "missing.sha256"))
+
+
+if __name__ == "__main__":
+    unittest.main()